@@ -0,0 +1,179 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+from collections import Counter
+import redis.asyncio
+from pyspell import Dictionary, index_deletes
+from storage import RedisStorage
+from text import Tokenizer, read_chunks
+
+__all__ = ['AsyncDictionary']
+
+
+class AsyncRedisStorage(object):
+    """
+    An asyncio storage on Redis, using a pool of at most `max_connections` connections. When all the connections
+    are busy, requests wait for one to be released (for at most `timeout` seconds).
+    It only provides the batch operations of `storage.Storage`, each one carried out with a single pipeline.
+    """
+    def __init__(self, max_connections=10, timeout=20, **kwargs):
+        self._pool = redis.asyncio.BlockingConnectionPool(max_connections=max_connections, timeout=timeout, **kwargs)
+        self._r = redis.asyncio.StrictRedis(connection_pool=self._pool)
+        self._sadd_shortest = self._r.register_script(RedisStorage._SADD_SHORTEST_SCRIPT)
+
+    async def close(self):
+        if hasattr(self._r, 'aclose'):  # redis-py >= 5
+            await self._r.aclose()
+        else:
+            await self._r.close()
+        await self._pool.disconnect()
+
+    async def flushdb(self):
+        await self._r.flushdb()
+
+    async def incrby_many(self, increments):
+        """
+        Increments several keys with native INCRBY commands sent in a single MULTI/EXEC pipeline.
+        """
+        async with self._r.pipeline(transaction=True) as pipe:
+            for key, incr in increments.items():
+                pipe.incrby(key, incr)
+            return await pipe.execute()
+
+    async def sadd_many(self, members, shortest_only=False, max_length=None):
+        """
+        See `storage.RedisStorage.sadd_many`.
+        """
+        async with self._r.pipeline(transaction=True) as pipe:
+            if not shortest_only:
+                for key, values in members.items():
+                    values = list(values)
+                    if values:
+                        pipe.exists(key)
+                        pipe.sadd(key, *values)
+                return sum(1 for existed in (await pipe.execute())[::2] if not existed)
+            else:
+                keys, args = [], [max_length or 0]
+                for key, values in members.items():
+                    values = list(values)
+                    if not values:
+                        continue
+                    keys.append(key)
+                    args.append(len(values))
+                    args.extend(values)
+                    if len(keys) == RedisStorage._SCRIPT_BATCH:
+                        await self._sadd_shortest(keys=keys, args=args, client=pipe)
+                        keys, args = [], [max_length or 0]
+                if keys:
+                    await self._sadd_shortest(keys=keys, args=args, client=pipe)
+                return sum(await pipe.execute())
+
+    async def fetch_many(self, keys, set_keys):
+        """
+        See `storage.RedisStorage.fetch_many`.
+        """
+        keys, set_keys = list(keys), list(set_keys)
+        async with self._r.pipeline(transaction=False) as pipe:
+            if keys:
+                pipe.mget(keys)
+            for key in set_keys:
+                pipe.smembers(key)
+            res = await pipe.execute()
+        values = []
+        for val in (res.pop(0) if keys else []):
+            try:
+                values.append(int(val) if val is not None else None)
+            except ValueError:
+                values.append(val)
+        sets = [set([int(el) if el.isdigit() else el for el in members]) for members in res]
+        return values, sets
+
+
+class AsyncDictionary(object):
+    """
+    An asyncio dictionary stored on Redis. Keys are the same used by `pyspell.Dictionary`, so synchronous and
+    asynchronous dictionaries with the same parameters can work on the same database.
+
+    The candidates of a lookup are fetched with a single pipeline, so lookups take two round trips at most,
+    and concurrent lookups share a pool of `max_connections` connections. Connection parameters (e.g., `host`,
+    `port` and `db`) are passed as keyword arguments.
+    """
+    def __init__(self, edit_distance_max=2, best_suggestions_only=True, prefix_length=None, max_connections=10,
+                 namespace=None, **kwargs):
+        self._store = AsyncRedisStorage(max_connections=max_connections, **kwargs)
+        # the dictionary does the work that doesn't involve the storage
+        self._dictionary = Dictionary(edit_distance_max=edit_distance_max,
+                                      best_suggestions_only=best_suggestions_only,
+                                      prefix_length=prefix_length, namespace=namespace, store=self._store)
+        self.edit_distance_max = edit_distance_max
+        self.best_suggestions_only = best_suggestions_only
+        self.prefix_length = prefix_length
+        self.namespace = namespace
+
+    async def close(self):
+        await self._store.close()
+
+    async def flush(self):
+        """
+        Deletes everything in the database.
+        """
+        await self._store.flushdb()
+
+    async def add_word(self, word):
+        await self.add_words([word])
+
+    async def add_words(self, words):
+        """
+        Adds all the `words` with one batch of writes.
+        """
+        await self._store_counts(Counter(words))
+
+    async def ingest(self, source, tokenizer=None, max_distinct=100000):
+        """
+        See `pyspell.Dictionary.ingest`. Reading `source` blocks the event loop.
+        """
+        tokenizer = tokenizer or Tokenizer()
+        counts = Counter()
+        for token in tokenizer.iter_tokens(read_chunks(source)):
+            counts[token] += 1
+            if len(counts) >= max_distinct:
+                await self._store_counts(counts)
+                counts = Counter()
+        if counts:
+            await self._store_counts(counts)
+
+    async def _store_counts(self, counts):
+        d = self._dictionary  # builds the keys, while the writes are awaited here
+        suggestions = index_deletes(counts, self.edit_distance_max, self.best_suggestions_only, self.prefix_length)
+        values = await self._store.incrby_many(dict((d._terms.key(word), count) for word, count in counts.items()))
+        new_deletes = await self._store.sadd_many(dict((d._suggestions.key(delete), words)
+                                                       for delete, words in suggestions.items()),
+                                                  shortest_only=d._suggestions.pruned,
+                                                  max_length=self.prefix_length)
+        stats = d._index_stats(counts, values, new_deletes)
+        await self._store.incrby_many(dict((d._stats.key(name), incr) for name, incr in stats.items() if incr))
+
+    async def _fetch(self, words, keys=()):
+        d = self._dictionary  # phonetic keys aren't indexed, so `keys` is always empty
+        values, sets = await self._store.fetch_many([d._terms.key(w) for w in words],
+                                                    [d._suggestions.key(w) for w in words])
+        return d._fetched(words, values, sets) + (dict(),)
+
+    async def lookup(self, word, return_distances=False):
+        return (await self.lookup_many([word], return_distances))[0]
+
+    async def lookup_many(self, words, return_distances=False):
+        """
+        See `pyspell.Dictionary.lookup_many`.
+        """
+        return await self._run(self._dictionary._lookup_many(words, return_distances))
+
+    async def _run(self, steps):
+        """
+        See `pyspell.Dictionary._run`.
+        """
+        try:
+            request = next(steps)
+            while True:
+                request = steps.send(await self._fetch(*request))
+        except StopIteration as e:
+            return e.value
@@ -0,0 +1,47 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import unittest
+from async_pyspell import AsyncDictionary
+from pyspell import Dictionary
+from pyspell_tests import keyspace
+
+redis_host = 'localhost'
+redis_port = 6379
+redis_db = 5
+
+
+class AsyncDictionaryTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.d = AsyncDictionary(host=redis_host, port=redis_port, db=redis_db, max_connections=4)
+        await self.d.flush()
+        self.words = ['apl', 'aple', 'apple', 'applex', 'orange', 'rnge', 'simone', 'simon', 'simon']
+
+    async def asyncTearDown(self):
+        await self.d.flush()
+        await self.d.close()
+
+    def sync_dictionary(self):
+        return Dictionary(storage_type='redis', host=redis_host, port=redis_port, db=redis_db)
+
+    async def test_same_keys(self):
+        await self.d.add_words(self.words)
+        await self.d.add_word('kiwi')
+        expected = Dictionary()
+        expected.add_words(self.words + ['kiwi'])
+        self.assertEqual(keyspace(expected), keyspace(self.sync_dictionary()))
+
+    async def test_lookup(self):
+        self.sync_dictionary().add_words(self.words)  # written by a synchronous client
+        words = ['apple', 'aplpe', 'orang', 'simo', 'xyz', 'rn']
+        expected = [self.sync_dictionary().lookup(word, True) for word in words]
+        self.assertListEqual(expected, await self.d.lookup_many(words, True))
+        self.assertListEqual(expected[3], await self.d.lookup('simo', True))
+
+    async def test_ingest(self):
+        await self.d.ingest(['Apple, apple', 'orange'])
+        self.assertListEqual(['apple'], await self.d.lookup('aple'))
+        self.assertEqual(2, self.sync_dictionary()._terms['apple'])
+
+
+if __name__ == '__main__':
+    unittest.main()
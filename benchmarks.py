@@ -0,0 +1,403 @@
+"""
+Benchmarks for pyspell. Run `python benchmarks.py <benchmark>`, e.g., `python benchmarks.py deletes`.
+
+The `suite` benchmark measures build and lookup performance for each storage backend and writes the results
+as JSON, e.g., `python benchmarks.py suite --words 50000 --output results.json`. Passing the JSON of a previous
+run as `--baseline` reports the metrics that got worse by more than `--tolerance`, and exits with status 1 if any.
+
+The `restore` benchmark compares, for each storage backend, building a dictionary from the corpus with restoring
+it from a snapshot (see `snapshot`), with and without the index of deletes.
+
+The `incremental` benchmark adds the corpus one word at a time and reports, for each storage backend, the time per
+word of each quarter of the corpus, which should not grow with the size of the dictionary.
+"""
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import argparse
+import io
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+from collections import Counter
+from itertools import islice
+import timeit
+import time
+import tracemalloc
+from bloom import BloomFilter
+from pyspell import Dictionary
+from storage import storage, RedisStorage
+from text import Tokenizer, read_chunks
+from word import Word
+
+
+def random_words(count, min_len=4, max_len=12, seed=0):
+    """
+    Returns `count` random lowercase words, with letters drawn according to their frequency in English
+    """
+    rnd = random.Random(seed)
+    letters = 'etaoinshrdlcumwfgypbvkjxqz'
+    weights = [12, 9, 8, 8, 7, 7, 6, 6, 6, 4, 4, 3, 3, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1]
+    return [''.join(rnd.choices(letters, weights, k=rnd.randint(min_len, max_len))) for _ in range(count)]
+
+
+def misspell(word, distance, rnd):
+    """
+    Applies `distance` random edits (deletions, insertions, substitutions or transpositions) to `word`
+    """
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    for _ in range(distance):
+        edit = rnd.choice(['delete', 'insert', 'substitute', 'transpose'] if len(word) > 1 else ['insert'])
+        i = rnd.randrange(len(word))
+        if edit == 'delete':
+            word = word[:i] + word[i + 1:]
+        elif edit == 'insert':
+            word = word[:i] + rnd.choice(letters) + word[i:]
+        elif edit == 'substitute':
+            word = word[:i] + rnd.choice(letters) + word[i + 1:]
+        else:
+            i = min(i, len(word) - 2)
+            word = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word
+
+
+class CountingStorage(object):
+    """
+    Wraps a storage and counts the calls to its methods
+    """
+    def __init__(self, store, calls=None):
+        self._store = store
+        self.calls = calls if calls is not None else Counter()
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if not callable(attr):
+            return attr
+        if name == 'snapshot':  # count the calls to the snapshots too
+            return lambda: CountingStorage(attr(), self.calls)
+
+        def counted(*args, **kwargs):
+            self.calls[name] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+    def __getitem__(self, key):
+        self.calls['__getitem__'] += 1
+        return self._store[key]
+
+    def __setitem__(self, key, value):
+        self.calls['__setitem__'] += 1
+        self._store[key] = value
+
+    def __contains__(self, key):
+        self.calls['__contains__'] += 1
+        return key in self._store
+
+
+def synthetic_corpus(size, seed=0):
+    """
+    Returns a corpus of `size` random words, drawn from a vocabulary of `size` / 5 words with Zipfian frequencies
+    """
+    rnd = random.Random(seed)
+    vocabulary = random_words(max(10, size // 5), seed=seed)
+    return rnd.choices(vocabulary, [1. / rank for rank in range(1, len(vocabulary) + 1)], k=size)
+
+
+def fixture_corpus(path, size):
+    """
+    Returns the first `size` words of the text file at `path`
+    """
+    return list(islice(Tokenizer().iter_tokens(read_chunks(path)), size))
+
+
+def misspelled_queries(corpus, count, max_distance=3, seed=0):
+    """
+    Returns, for each distance from 0 to `max_distance`, `count` tuples (word, query) where `query` is a word of the
+    `corpus` misspelled with that many edits
+    """
+    rnd = random.Random(seed)
+    return dict((distance, [(word, misspell(word, distance, rnd)) for word in rnd.choices(corpus, k=count)])
+                for distance in range(max_distance + 1))
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process, in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def redis_client(url=None):
+    """
+    Returns a client of the Redis at `url` or, if no `url` is specified, an in-process fake (requires fakeredis)
+    """
+    if url:
+        import redis
+        return redis.StrictRedis.from_url(url, decode_responses=True)
+    import fakeredis
+    return fakeredis.FakeStrictRedis(decode_responses=True)
+
+
+BACKENDS = {'dict': lambda args: storage(None),
+            'compact': lambda args: storage('compact'),
+            'snapshot': lambda args: storage('snapshot'),
+            'redis': lambda args: RedisStorage(flush_db=True, client=redis_client(args.redis))}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_backend(backend, corpus, queries, args):
+    """
+    Builds a dictionary from the `corpus` on storage `backend`, looks up the `queries` and returns the metrics
+    """
+    rss = peak_rss()
+    store = CountingStorage(BACKENDS[backend](args))
+    d = Dictionary(store=store)
+    start = time.time()
+    d.add_words(corpus, chunk_size=args.chunk_size)
+    metrics = {'build_s': time.time() - start, 'rss_growth_mb': (peak_rss() - rss) / 2. ** 20}
+    metrics.update(d.stats())
+    metrics['keys'] = metrics['terms'] + metrics['deletes']
+    lookups = dict()
+    for distance, pairs in sorted(queries.items()):
+        store.calls.clear()
+        latencies, found = [], 0
+        start = time.time()
+        for word, query in pairs:
+            begin = time.perf_counter()
+            results = d.lookup(query)
+            latencies.append(time.perf_counter() - begin)
+            found += word in results
+        elapsed = time.time() - start
+        lookups[str(distance)] = {'p50_us': percentile(latencies, .5) * 1e6, 'p99_us': percentile(latencies, .99) * 1e6,
+                                  'throughput': len(pairs) / elapsed, 'recall': float(found) / len(pairs),
+                                  'calls_per_lookup': float(sum(store.calls.values())) / len(pairs)}
+    metrics['lookups'] = lookups
+    return metrics
+
+
+def _run_backend(params):
+    return run_backend(*params)
+
+
+# direction of the metrics compared against a baseline: 1 if lower is better, -1 if higher is better
+METRICS = {'build_s': 1, 'rss_growth_mb': 1, 'keys': 1, 'p50_us': 1, 'p99_us': 1, 'calls_per_lookup': 1,
+           'throughput': -1, 'recall': -1}
+
+
+def _flatten(metrics, path=()):
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            for item in _flatten(value, path + (name,)):
+                yield item
+        elif name in METRICS:
+            yield path + (name,), value
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Compares the `results` of the suite with a `baseline`, i.e., the results of a previous run, and returns the
+    list of tuples (metric, baseline value, value) for the metrics that got worse by more than `tolerance`
+    (a fraction of the baseline value). Metrics missing in either run are ignored.
+    """
+    base = dict(_flatten(baseline['results']))
+    regressions = []
+    for path, value in _flatten(results['results']):
+        if path not in base:
+            continue
+        limit = base[path] * (1 + tolerance) if METRICS[path[-1]] > 0 else base[path] / (1 + tolerance)
+        if (value - limit) * METRICS[path[-1]] > 0:
+            regressions.append(('.'.join(path), base[path], value))
+    return regressions
+
+
+def run_suite(args):
+    """
+    Runs the suite on each backend in a separate process, so that memory measurements don't interfere
+    """
+    corpus = fixture_corpus(args.corpus, args.words) if args.corpus else synthetic_corpus(args.words)
+    queries = misspelled_queries(corpus, args.queries)
+    backends = args.backends.split(',')
+    context = multiprocessing.get_context('fork' if sys.platform != 'win32' else 'spawn')
+    results = dict()
+    for backend in backends:
+        pool = context.Pool(1)
+        try:
+            results[backend] = pool.apply(_run_backend, [(backend, corpus, queries, args)])
+        finally:
+            pool.close()
+            pool.join()
+    return {'version': 1, 'python': platform.python_version(),
+            'config': {'corpus': args.corpus or 'synthetic', 'words': len(corpus), 'queries': args.queries,
+                       'chunk_size': args.chunk_size},
+            'results': results}
+
+
+def recursive_deletes(word, edit_distance):
+    """
+    The recursive implementation of `Word.deletes` up to version 0.1, kept as a reference
+    """
+    dels = set()
+    if len(word) <= 1 or edit_distance == 0:
+        return dels
+    for i in range(len(word)):
+        delete = word[:i] + word[i+1:]
+        dels.update([delete])
+        dels.update(recursive_deletes(delete, edit_distance - 1))
+    return dels
+
+
+def measure(func, repeat=3):
+    """
+    Returns a tuple with the best running time of `func` over `repeat` runs, in seconds,
+    and the peak memory it allocated, in bytes
+    """
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def bench_deletes(args):
+    words = random_words(args.words)
+    implementations = [('recursive', lambda w, d: recursive_deletes(w, d)),
+                       ('iterative', lambda w, d: list(Word.iter_deletes(w, d))),
+                       ('iterative cached', lambda w, d: list(Word.iter_deletes(w, d, cached=True)))]
+    print('%-18s %8s %12s %14s' % ('implementation', 'distance', 'time (ms)', 'peak (KB)'))
+    for distance in (1, 2, 3):
+        for name, deletes in implementations:
+            elapsed, peak = measure(lambda: [deletes(w, distance) for w in words])
+            print('%-18s %8d %12.1f %14.1f' % (name, distance, elapsed * 1000, peak / 1024.))
+
+
+def bench_prefix(args):
+    rnd = random.Random(1)
+    vocabulary = random_words(args.words, max_len=16)
+    corpus = [rnd.choice(vocabulary[:1 + rnd.randrange(len(vocabulary))]) for _ in range(5 * args.words)]
+    queries = [(word, misspell(word, rnd.randint(1, 2), rnd)) for word in rnd.sample(corpus, min(1000, len(corpus)))]
+    print('%-8s %10s %12s %10s %14s %10s %10s' % ('prefix', 'build (s)', 'deletes', 'memory (MB)',
+                                                  'lookup (us)', 'recall', 'top-1'))
+    for prefix_length in (None, 5, 6, 7, 8, 10):
+        tracemalloc.start()
+        start = time.time()
+        d = Dictionary(prefix_length=prefix_length)
+        d.add_words(corpus, chunk_size=10000)
+        build = time.time() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.time()
+        results = [(word, d.lookup(typo)) for word, typo in queries]
+        latency = (time.time() - start) / len(queries)
+        recall = sum(word in res for word, res in results) / float(len(results))
+        top1 = sum(res[:1] == [word] for word, res in results) / float(len(results))
+        print('%-8s %10.2f %12d %10.1f %14.1f %10.3f %10.3f' % (prefix_length, build, len(d._suggestions.terms),
+                                                                memory / 2. ** 20, latency * 1e6, recall, top1))
+
+
+def bench_bloom(args):
+    rnd = random.Random(1)
+    vocabulary = random_words(args.words)
+    queries = [misspell(rnd.choice(vocabulary), rnd.randint(0, 2), rnd) for _ in range(1000)]
+    print('%-10s %12s %14s %12s' % ('filter', 'calls/lookup', 'lookup (us)', 'fp rate'))
+    for bloom in (None, BloomFilter(capacity=60 * len(vocabulary), error_rate=0.01)):
+        store = CountingStorage(storage(None))
+        d = Dictionary(store=store, bloom_filter=bloom)
+        d.add_words(vocabulary, chunk_size=10000)
+        store.calls.clear()
+        start = time.time()
+        for query in queries:
+            d.lookup(query)
+        latency = (time.time() - start) / len(queries)
+        print('%-10s %12.1f %14.1f %12s' % ('bloom' if bloom else 'none', sum(store.calls.values()) / 1000.,
+                                            latency * 1e6, '%.4f' % bloom.false_positive_rate if bloom else '-'))
+
+
+def bench_suite(args):
+    results = run_suite(args)
+    print('%-10s %10s %10s %10s %8s %10s %10s %12s %8s %8s' % ('backend', 'build (s)', 'rss (MB)', 'keys', 'dist',
+                                                            'p50 (us)', 'p99 (us)', 'lookups/s', 'calls', 'recall'))
+    for backend, metrics in sorted(results['results'].items()):
+        for distance, lookups in sorted(metrics['lookups'].items()):
+            print('%-10s %10.2f %10.1f %10d %8s %10.1f %10.1f %12.0f %8.1f %8.3f' % (
+                backend, metrics['build_s'], metrics['rss_growth_mb'], metrics['keys'], distance, lookups['p50_us'],
+                lookups['p99_us'], lookups['throughput'], lookups['calls_per_lookup'], lookups['recall']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for metric, before, after in regressions:
+            print('regression: %s %.3f -> %.3f' % (metric, before, after))
+        return 1 if regressions else 0
+
+
+def bench_restore(args):
+    corpus = fixture_corpus(args.corpus, args.words) if args.corpus else synthetic_corpus(args.words)
+    print('%-10s %10s %8s %11s %10s %12s %10s' % ('backend', 'build (s)', 'index', 'export (s)', 'size (KB)',
+                                                 'restore (s)', 'speedup'))
+    for backend in args.backends.split(','):
+        store = BACKENDS[backend](args)
+        d = Dictionary(store=store)
+        start = time.time()
+        d.add_words(corpus, chunk_size=args.chunk_size)
+        build = time.time() - start
+        for include_index in (False, True):
+            f = io.BytesIO()
+            start = time.time()
+            d.export(f, include_index, batch_size=args.chunk_size)
+            export = time.time() - start
+            f.seek(0)
+            # restored in a namespace of the same storage, which is the only one for some backends
+            restored = Dictionary(store=store, namespace='restored%d' % include_index)
+            start = time.time()
+            restored.restore(f, batch_size=args.chunk_size)
+            elapsed = time.time() - start
+            assert restored.stats() == d.stats()
+            print('%-10s %10.2f %8s %11.2f %10.1f %12.2f %10.1f' % (backend, build, include_index, export,
+                                                                 len(f.getvalue()) / 1024., elapsed, build / elapsed))
+
+
+def bench_incremental(args):
+    words = random_words(args.words)
+    quarters = [args.words * i // 4 for i in range(5)]
+    print(('%-10s' + ' %14s' * 4) % (('backend',) + tuple('%d words (us)' % n for n in quarters[1:])))
+    for backend in args.backends.split(','):
+        d = Dictionary(store=BACKENDS[backend](args))
+        times = []
+        for start, end in zip(quarters, quarters[1:]):
+            begin = time.time()
+            for word in words[start:end]:
+                d.add_word(word)
+            times.append((time.time() - begin) / max(end - start, 1) * 1e6)
+        print(('%-10s' + ' %14.1f' * 4) % ((backend,) + tuple(times)))
+
+
+BENCHMARKS = {'deletes': bench_deletes, 'prefix': bench_prefix, 'bloom': bench_bloom, 'suite': bench_suite,
+              'restore': bench_restore, 'incremental': bench_incremental}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs pyspell benchmarks.')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--words', type=int, default=2000, help='number of words (default: 2000)')
+    parser.add_argument('--corpus', help='text file to take the words from (default: synthetic words)')
+    parser.add_argument('--queries', type=int, default=500, help='lookups per misspelling distance (default: 500)')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='chunk size of add_words (default: 10000)')
+    parser.add_argument('--backends', default='dict,compact,snapshot,redis',
+                        help='comma separated storage backends (default: dict,compact,snapshot,redis)')
+    parser.add_argument('--redis', help='Redis URL, e.g. redis://localhost:6379/9 (default: fakeredis)')
+    parser.add_argument('--output', help='file to write the JSON results to')
+    parser.add_argument('--baseline', help='JSON results to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative worsening reported as a regression (default: 0.2)')
+    args = parser.parse_args()
+    sys.exit(BENCHMARKS[args.benchmark](args))
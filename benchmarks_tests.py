@@ -0,0 +1,44 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import argparse
+import unittest
+from benchmarks import compare, misspelled_queries, run_backend, synthetic_corpus
+from word import Word
+
+
+class SuiteTests(unittest.TestCase):
+    def test_queries(self):
+        corpus = synthetic_corpus(500)
+        self.assertEqual(500, len(corpus))
+        queries = misspelled_queries(corpus, 20)
+        self.assertListEqual([0, 1, 2, 3], sorted(queries))
+        for distance, pairs in queries.items():
+            self.assertEqual(20, len(pairs))
+            for word, query in pairs:
+                self.assertIn(word, corpus)
+                if distance <= 1:  # further edits may not add up with the restricted Damerau-Levenshtein distance
+                    self.assertLessEqual(Word.damerau_levenshtein_distance(word, query), distance)
+
+    def test_run_backend(self):
+        corpus = synthetic_corpus(300)
+        args = argparse.Namespace(chunk_size=100, redis=None)
+        for backend in ('dict', 'snapshot'):
+            metrics = run_backend(backend, corpus, misspelled_queries(corpus, 10), args)
+            self.assertEqual(len(set(corpus)), metrics['terms'])
+            self.assertEqual(metrics['terms'] + metrics['deletes'], metrics['keys'])
+            self.assertEqual(1., metrics['lookups']['0']['recall'])
+            self.assertGreater(metrics['lookups']['1']['calls_per_lookup'], 1)
+
+    def test_compare(self):
+        baseline = {'results': {'dict': {'build_s': 1., 'keys': 100, 'lookups': {'1': {'p50_us': 10., 'recall': .9,
+                                                                                    'throughput': 1000.}}}}}
+        results = {'results': {'dict': {'build_s': 1.1, 'keys': 130, 'lookups': {'1': {'p50_us': 9., 'recall': .7,
+                                                                                   'throughput': 900.}}},
+                               'redis': {'build_s': 5.}}}
+        self.assertListEqual([('dict.keys', 100, 130), ('dict.lookups.1.recall', .9, .7)],
+                             sorted(compare(results, baseline, tolerance=0.2)))
+        self.assertListEqual([], compare(baseline, baseline))
+
+
+if __name__ == '__main__':
+    unittest.main()
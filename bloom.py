@@ -0,0 +1,66 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import hashlib
+import math
+import struct
+
+
+class BloomFilter(object):
+    """
+    A probabilistic set of strings: membership tests may return false positives, with probability
+    `error_rate` once `capacity` strings have been added, but never false negatives.
+
+    Bits are kept in a bytearray. The positions of a string are derived from two 64-bit hashes of its
+    UTF-8 encoding (BLAKE2b), so they don't change across processes and the filter can be persisted
+    with `to_bytes` and restored with `from_bytes`.
+    """
+    _HEADER = struct.Struct('<QII')  # number of bits, number of hashes, number of strings added
+
+    def __init__(self, capacity=100000, error_rate=0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_bits = num_bits + (-num_bits % 8)
+        self.num_hashes = max(1, int(round(float(self.num_bits) / capacity * math.log(2))))
+        self.count = 0
+        self._bits = bytearray(self.num_bits // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def false_positive_rate(self):
+        """
+        The current false positive rate, estimated from the fraction of bits set.
+        """
+        bits_set = sum(bin(byte).count('1') for byte in self._bits)
+        return (float(bits_set) / self.num_bits) ** self.num_hashes
+
+    def to_bytes(self):
+        return self._HEADER.pack(self.num_bits, self.num_hashes, self.count) + bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Restores a filter serialized with `to_bytes`. `data` can be any object supporting the buffer protocol.
+        """
+        num_bits, num_hashes, count = cls._HEADER.unpack_from(data, 0)
+        bloom = cls.__new__(cls)
+        bloom.num_bits, bloom.num_hashes, bloom.count = num_bits, num_hashes, count
+        bloom.capacity, bloom.error_rate = None, None
+        bloom._bits = bytearray(memoryview(data)[cls._HEADER.size:cls._HEADER.size + num_bits // 8])
+        return bloom
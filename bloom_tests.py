@@ -0,0 +1,33 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import unittest
+from bloom import BloomFilter
+
+
+class BloomFilterTests(unittest.TestCase):
+    def setUp(self):
+        self.bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        self.items = ['item%d' % i for i in range(1000)]
+        for item in self.items:
+            self.bloom.add(item)
+
+    def test_membership(self):
+        for item in self.items:
+            self.assertIn(item, self.bloom)  # no false negatives
+        false_positives = sum(('other%d' % i) in self.bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertLess(self.bloom.false_positive_rate, 0.03)
+        self.assertEqual(0, BloomFilter(capacity=10).false_positive_rate)
+
+    def test_bytes(self):
+        bloom = BloomFilter.from_bytes(self.bloom.to_bytes())
+        self.assertEqual(1000, bloom.count)
+        for item in self.items:
+            self.assertIn(item, bloom)
+        self.assertEqual(self.bloom.false_positive_rate, bloom.false_positive_rate)
+        bloom.add(u'caff\xe8')
+        self.assertIn(u'caff\xe8', bloom)
+
+
+if __name__ == '__main__':
+    unittest.main()
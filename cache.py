@@ -0,0 +1,66 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import time
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRUCache(object):
+    """
+    A bounded cache that evicts the least recently used items first.
+
+    Calling `invalidate` starts a new generation of the cache and drops all the items stored so far.
+    Values computed before an invalidation can be prevented from entering the cache by passing to `put`
+    the generation read before computing them. If `ttl` is specified, items also become stale `ttl`
+    seconds after they have been stored.
+    """
+    def __init__(self, maxsize=1024, ttl=None, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._timer = timer
+        self._items = OrderedDict()  # key -> (expiration time, value)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """
+        Returns the value of `key` or `default` if `key` is not in the cache or is stale.
+        """
+        item = self._items.pop(key, None)
+        if item is None or (item[0] is not None and item[0] < self._timer()):
+            self.misses += 1
+            return default
+        self._items[key] = item  # re-insert `key` as the most recently used
+        self.hits += 1
+        return item[1]
+
+    def put(self, key, value, generation=None):
+        """
+        Stores `value` as the value of `key`, possibly evicting the least recently used item.
+        If `generation` is specified and the cache has been invalidated since then, nothing is stored.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        self._items.pop(key, None)
+        expiration = self._timer() + self.ttl if self.ttl is not None else None
+        self._items[key] = (expiration, value)
+        while len(self._items) > self.maxsize:
+            try:
+                self._items.popitem(last=False)
+            except KeyError:  # emptied by another thread
+                break
+
+    def invalidate(self):
+        """
+        Makes all the items currently stored stale.
+        """
+        self.generation += 1
+        self._items.clear()
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._items))
@@ -0,0 +1,42 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import unittest
+from cache import LRUCache
+
+
+class LRUCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = LRUCache(maxsize=2, ttl=10, timer=lambda: self.now)
+
+    def test_lru(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.assertEqual(1, self.cache.get('a'))
+        self.cache.put('c', 3)  # evicts 'b', the least recently used
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(1, self.cache.get('a'))
+        self.assertEqual(3, self.cache.get('c'))
+        self.assertEqual((3, 1, 2, 2), tuple(self.cache.info()))
+
+    def test_invalidate(self):
+        self.cache.put('a', 1)
+        generation = self.cache.generation
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', 1, generation)  # computed before the invalidation
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', 2, self.cache.generation)
+        self.assertEqual(2, self.cache.get('a'))
+
+    def test_ttl(self):
+        self.cache.put('a', 1)
+        self.now = 10
+        self.assertEqual(1, self.cache.get('a'))
+        self.now = 11
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(0, len(self.cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
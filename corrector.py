@@ -0,0 +1,158 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import math
+from collections import namedtuple
+from itertools import islice
+from text import Tokenizer
+
+Correction = namedtuple('Correction', ['start', 'end', 'original', 'replacement'])
+
+
+class TextCorrector(object):
+    """
+    Corrects whole texts with a `Dictionary`. Tokens are corrected individually, split into several known words
+    (e.g., "newyork" into "new york") or merged with the following token (e.g., "mou ntains" into "mountains"),
+    whichever is the most likely according to the frequencies of the words in the dictionary and to the
+    probability `edit_probability` of a single edit (a correction, a split or a merge).
+
+    Text is processed in batches of `batch_size` tokens: distinct tokens are checked with a single storage
+    access, and only the unknown ones are looked up, so the work is linear in the length of the text. Tokens
+    in different batches are never merged. Tokens longer than `max_word_length` characters, or that aren't
+    made of letters only, are left unchanged.
+    """
+    def __init__(self, dictionary, tokenizer=None, batch_size=1000, edit_probability=0.01, max_word_length=24):
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        if not 0 < edit_probability < 1:
+            raise ValueError('edit_probability must be between 0 and 1')
+        self.dictionary = dictionary
+        self.tokenizer = tokenizer or Tokenizer()
+        self.batch_size = batch_size
+        self.edit_probability = edit_probability
+        self.max_word_length = max_word_length
+
+    def correct(self, text):
+        """
+        Returns a tuple with the corrected `text` and the list of the corrections made.
+        """
+        corrected, corrections, offset = [], [], 0
+        for correction in self.corrections(text):
+            corrected.extend([text[offset:correction.start], correction.replacement])
+            corrections.append(correction)
+            offset = correction.end
+        corrected.append(text[offset:])
+        return ''.join(corrected), corrections
+
+    def corrections(self, text):
+        """
+        Generates the corrections of `text`, in order of appearance, as `Correction` tuples where `start` and
+        `end` are the offsets of the `original` text replaced.
+        """
+        spans = self.tokenizer.spans(text)
+        total = self.dictionary.stats()['occurrences']
+        while True:
+            batch = list(islice(spans, self.batch_size))
+            if not batch:
+                break
+            for correction in self._correct_batch(text, batch, total):
+                yield correction
+
+    def _correctable(self, token):
+        return token.isalpha() and len(token) <= self.max_word_length
+
+    def _correct_batch(self, text, batch, total):
+        """
+        Generates the corrections of the tokens in `batch`, a list of spans of `text`.
+        """
+        tokens = [span[2] for span in batch]
+        merges = dict((i, tokens[i] + tokens[i + 1]) for i in range(len(batch) - 1)
+                      if not text[batch[i][1]:batch[i + 1][0]].strip()
+                      and self._correctable(tokens[i]) and self._correctable(tokens[i + 1])
+                      and len(tokens[i]) + len(tokens[i + 1]) <= self.max_word_length)
+        counts = self.dictionary.frequencies(set(tokens).union(merges.values()))
+        unknown = set(t for t in tokens if not counts[t] and self._correctable(t))
+        merges = dict((i, merge) for i, merge in merges.items() if tokens[i] in unknown or tokens[i + 1] in unknown)
+        looked_up = list(unknown.union(m for m in merges.values() if not counts[m]))
+        best = dict((word, res[0]) for word, res in zip(looked_up, self.dictionary.lookup_many(looked_up, True))
+                    if res)
+        parts = set(token[i:j] for token in unknown for i in range(len(token)) for j in range(i + 1, len(token) + 1))
+        counts.update(self.dictionary.frequencies(parts.union(s for s, _ in best.values()).difference(counts)))
+
+        total = total or sum(counts.values()) or 1
+        edit = math.log(self.edit_probability)
+        unknown_cost = math.log(1.0 / total) + (self.dictionary.edit_distance_max + 1) * edit
+
+        def log_probability(word):
+            return math.log(float(counts[word]) / total) if counts[word] else None
+
+        def corrected(word):
+            """
+            Returns the best correction of an unknown `word` in `best`, with its log-probability. Suggestions
+            without occurrences, e.g. removed since they were looked up, aren't corrections.
+            """
+            if word not in best:
+                return None, None
+            suggestion, distance = best[word]
+            probability = log_probability(suggestion)
+            if probability is None:
+                return None, None
+            return suggestion, probability + distance * edit
+
+        def split(word):
+            """
+            Returns the most likely split of `word` into known words, with its log-probability.
+            """
+            scores = [(0.0, 0)] + [(None, None)] * len(word)
+            for j in range(1, len(word) + 1):
+                for i in range(j):
+                    part = log_probability(word[i:j])
+                    if scores[i][0] is not None and part is not None and \
+                            (scores[j][0] is None or scores[i][0] + part + edit > scores[j][0]):
+                        scores[j] = (scores[i][0] + part + edit, i)
+            if scores[-1][0] is None:
+                return None, None
+            words, j = [], len(word)
+            while j > 0:
+                words.append(word[scores[j][1]:j])
+                j = scores[j][1]
+            return (' '.join(reversed(words)), scores[-1][0] - edit) if len(words) > 1 else (None, None)
+
+        singles = []
+        for token in tokens:
+            if token not in unknown:
+                singles.append((None, log_probability(token) or 0.0))
+                continue
+            options = [(None, unknown_cost), corrected(token), split(token)]
+            singles.append(max((o for o in options if o[1] is not None), key=lambda o: o[1]))
+        merged = dict()
+        for i, merge in merges.items():
+            suggestion, score = (merge, log_probability(merge)) if counts[merge] else corrected(merge)
+            merged[i] = (suggestion, score + edit if score is not None else None)
+
+        # chooses between single tokens and merges with a linear dynamic program over the batch
+        scores = [(0.0, None)] + [None] * len(tokens)
+        for k in range(1, len(tokens) + 1):
+            scores[k] = (scores[k - 1][0] + singles[k - 1][1], 1)
+            if merged.get(k - 2, (None, None))[1] is not None and scores[k - 2][0] + merged[k - 2][1] > scores[k][0]:
+                scores[k] = (scores[k - 2][0] + merged[k - 2][1], 2)
+        choices, k = [], len(tokens)
+        while k > 0:
+            choices.append((k - scores[k][1], scores[k][1]))
+            k -= scores[k][1]
+        for i, width in reversed(choices):
+            replacement = singles[i][0] if width == 1 else merged[i][0]
+            if replacement is not None:
+                start, end = batch[i][0], batch[i + width - 1][1]
+                yield Correction(start, end, text[start:end], self._cased(text[start:end], replacement))
+
+    def _cased(self, original, replacement):
+        """
+        Returns `replacement` with the case of the `original` text, if the tokenizer lowercases tokens.
+        """
+        if not self.tokenizer.lowercase:
+            return replacement
+        if len(original) > 1 and original.isupper():
+            return replacement.upper()
+        if original[:1].isupper():
+            return replacement[:1].upper() + replacement[1:]
+        return replacement
@@ -0,0 +1,53 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import unittest
+from corrector import Correction, TextCorrector
+from pyspell import Dictionary
+from text import Tokenizer
+
+
+class TextCorrectorTests(unittest.TestCase):
+    def setUp(self):
+        self.d = Dictionary()
+        text = 'i live in new york near the mountains and the museum of art in the city of new york'
+        self.d.add_words(text.split() * 3)
+
+    def test_correct(self):
+        text = 'I live in newyork near the mou ntains, 2nd musuem'
+        corrected, corrections = self.d.correct_text(text)
+        self.assertEqual('I live in new york near the mountains, 2nd museum', corrected)
+        self.assertListEqual([Correction(10, 17, 'newyork', 'new york'), Correction(27, 37, 'mou ntains', 'mountains'),
+                              Correction(43, 49, 'musuem', 'museum')], corrections)
+        for correction in corrections:
+            self.assertEqual(correction.original, text[correction.start:correction.end])
+        self.assertEqual(('the city of new york', []), self.d.correct_text('the city of new york'))
+        self.assertEqual(('', []), self.d.correct_text(''))
+
+    def test_case(self):
+        self.assertEqual('NEW YORK Museum', self.d.correct_text('NEWYORK Musuem')[0])
+        corrector = TextCorrector(self.d, tokenizer=Tokenizer(lowercase=False))
+        self.assertEqual(('museum', [Correction(0, 6, 'Museum', 'museum')]), corrector.correct('Museum'))
+
+    def test_batches(self):
+        text = ' '.join(['musuem', 'newyork', 'mou ntains'] * 10)
+        expected = ' '.join(['museum', 'new york', 'mountains'] * 10)
+        for batch_size in (4, 8, 1000):
+            self.assertEqual(expected, TextCorrector(self.d, batch_size=batch_size).correct(text)[0])
+        # tokens are never merged across batches
+        self.assertNotEqual('mountains', TextCorrector(self.d, batch_size=1).correct('mou ntains')[0])
+        self.assertRaises(ValueError, lambda: TextCorrector(self.d, batch_size=0))
+        self.assertRaises(ValueError, lambda: TextCorrector(self.d, edit_probability=1))
+
+    def test_unknown(self):
+        # words too far from any known word are left unchanged
+        self.assertEqual(('xyzzy and the', []), self.d.correct_text('xyzzy and the'))
+        self.assertEqual(('abc123', []), self.d.correct_text('abc123'))
+
+    def test_removed_suggestions(self):
+        # suggestions whose count is gone, e.g. removed by another client, are never corrections
+        self.d._store.delete_many([self.d._terms.key('museum')])
+        self.assertEqual(('the musuem of art', []), self.d.correct_text('the musuem of art'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+QWERTY = ('qwertyuiop', 'asdfghjkl', 'zxcvbnm')
+
+
+class EditCosts(object):
+    """
+    The costs of the edits used to rank suggestions (see `Word.weighted_distance`). Every cost is 1, to be
+    extended: costs must be greater than 0 and not greater than 1, so that the weighted distance between two words
+    never exceeds their Damerau-Levenshtein distance. The weighted distance of suggestions whose phonetic key is
+    the same as the word looked up is multiplied by `phonetic`.
+    """
+    def __init__(self, phonetic=0.5):
+        if not 0 < phonetic <= 1:
+            raise ValueError('phonetic must be greater than 0 and not greater than 1.')
+        self.phonetic = phonetic
+
+    def insertion(self, char):
+        return 1
+
+    def deletion(self, char):
+        return 1
+
+    def substitution(self, char1, char2):
+        return 1
+
+    def transposition(self, char1, char2):
+        return 1
+
+
+class KeyboardCosts(EditCosts):
+    """
+    Edit costs of typing on a keyboard whose rows of keys are `rows`, each one shifted to the right of the row above
+    by half a key. Substituting a character with the one of an adjacent key costs `adjacent`, and swapping two
+    adjacent characters costs `transposition`.
+    """
+    def __init__(self, rows=QWERTY, adjacent=0.5, transposition=0.75, phonetic=0.5):
+        super(KeyboardCosts, self).__init__(phonetic)
+        for cost in (adjacent, transposition):
+            if not 0 < cost <= 1:
+                raise ValueError('Costs must be greater than 0 and not greater than 1.')
+        self._adjacent_cost = adjacent
+        self._transposition_cost = transposition
+        self._adjacent = set()
+        positions = dict((key, (i, j)) for i, row in enumerate(rows) for j, key in enumerate(row))
+        for key, (i, j) in positions.items():
+            # the same row, the row above (at the same and the next column) and the row below
+            for row, column in ((i, j - 1), (i, j + 1), (i - 1, j), (i - 1, j + 1), (i + 1, j - 1), (i + 1, j)):
+                if 0 <= row < len(rows) and 0 <= column < len(rows[row]):
+                    self._adjacent.add((key, rows[row][column]))
+
+    def adjacent(self, char1, char2):
+        """
+        Returns True if the keys of `char1` and `char2` are adjacent.
+        """
+        return (char1.lower(), char2.lower()) in self._adjacent
+
+    def substitution(self, char1, char2):
+        return self._adjacent_cost if self.adjacent(char1, char2) else 1
+
+    def transposition(self, char1, char2):
+        return self._transposition_cost
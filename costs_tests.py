@@ -0,0 +1,27 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import unittest
+from costs import EditCosts, KeyboardCosts
+
+
+class KeyboardCostsTests(unittest.TestCase):
+    def test_adjacent(self):
+        costs = KeyboardCosts()
+        for char1, char2 in (('q', 'w'), ('s', 'w'), ('s', 'e'), ('s', 'z'), ('s', 'x'), ('m', 'n'), ('m', 'k')):
+            self.assertTrue(costs.adjacent(char1, char2))
+            self.assertTrue(costs.adjacent(char2.upper(), char1))
+            self.assertEqual(0.5, costs.substitution(char1, char2))
+        for char1, char2 in (('q', 'p'), ('s', 'q'), ('s', 'r'), ('z', 'd'), ('m', 'h'), ('a', '1')):
+            self.assertFalse(costs.adjacent(char1, char2))
+            self.assertEqual(1, costs.substitution(char1, char2))
+        self.assertEqual(0.75, costs.transposition('a', 'b'))
+        self.assertEqual(1, costs.insertion('a'))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, lambda: KeyboardCosts(adjacent=0))
+        self.assertRaises(ValueError, lambda: KeyboardCosts(transposition=1.5))
+        self.assertRaises(ValueError, lambda: EditCosts(phonetic=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
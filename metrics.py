@@ -0,0 +1,140 @@
+"""
+Instrumentation of dictionaries and storages.
+
+An observer is any object with the methods `count(name, value)` and `timing(name, seconds)`. A dictionary created
+with an observer reports:
+- `lookup` and `lookup_many` (timings): the time taken by each call;
+- `deletes`: the candidates generated for the words looked up;
+- `probes.terms`, `hits.terms` and `misses.terms`: the terms (`t:` keys) read, and whether they were found;
+- `probes.suggestions`, `hits.suggestions` and `misses.suggestions`: the same for suggestions (`s:` keys);
+- `distances`: the Damerau-Levenshtein distances computed;
+- `results`: the results returned.
+and its storage, wrapped in an `InstrumentedStorage`, reports:
+- `storage.<method>` (timings): the time taken by each call to a method of the storage;
+- `storage.bytes`: the size of the values and set members read, in UTF-8 encoded bytes.
+"""
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import re
+import threading
+import time
+from collections import namedtuple
+
+Timing = namedtuple('Timing', ['count', 'total', 'min', 'max'])
+
+
+class Observer(object):
+    """
+    An observer that ignores everything, to be extended
+    """
+    def count(self, name, value=1):
+        return
+
+    def timing(self, name, seconds):
+        return
+
+
+def _size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (set, frozenset, list)):
+        return sum(_size(member) for member in value)
+    return len(str(value).encode('utf-8'))
+
+
+class InstrumentedStorage(object):
+    """
+    Wraps a storage and reports the latency of each method call, and the bytes read, to `observer`.
+    """
+    _READERS = ('__getitem__', 'smembers', 'fetch_many')
+
+    def __init__(self, store, observer):
+        self._store = store
+        self._observer = observer
+
+    def _timed(self, name, method):
+        observer = self._observer
+
+        def timed(*args, **kwargs):
+            start = time.time()
+            res = method(*args, **kwargs)
+            observer.timing('storage.' + name, time.time() - start)
+            if name in self._READERS:
+                observer.count('storage.bytes', _size(res[0]) + sum(_size(s) for s in res[1])
+                               if name == 'fetch_many' else _size(res))
+            return res
+        return timed
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if not callable(attr):
+            return attr
+        if name == 'snapshot':  # instrument the snapshots too
+            return lambda: InstrumentedStorage(attr(), self._observer)
+        return self._timed(name, attr)
+
+    def __getitem__(self, key):
+        return self._timed('__getitem__', self._store.__getitem__)(key)
+
+    def __setitem__(self, key, value):
+        self._timed('__setitem__', self._store.__setitem__)(key, value)
+
+    def __delitem__(self, key):
+        self._timed('__delitem__', self._store.__delitem__)(key)
+
+    def __contains__(self, key):
+        return self._timed('__contains__', self._store.__contains__)(key)
+
+
+class MetricsCollector(Observer):
+    """
+    An observer that aggregates counts and timings, and can be shared by several dictionaries and threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict()
+        self._timings = dict()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + value
+
+    def timing(self, name, seconds):
+        with self._lock:
+            current = self._timings.get(name)
+            if current is None:
+                self._timings[name] = Timing(1, seconds, seconds, seconds)
+            else:
+                self._timings[name] = Timing(current.count + 1, current.total + seconds,
+                                             min(current.min, seconds), max(current.max, seconds))
+
+    def snapshot(self, reset=False):
+        """
+        Returns a tuple with a dictionary of the counts and a dictionary of the timings (as `Timing` tuples)
+        collected so far, which are then cleared if `reset` is True.
+        """
+        with self._lock:
+            counts, timings = dict(self._counts), dict(self._timings)
+            if reset:
+                self._counts.clear()
+                self._timings.clear()
+        return counts, timings
+
+    def exposition(self, prefix='pyspell'):
+        """
+        Returns the metrics in the Prometheus text exposition format. Counts are exported as counters, and
+        timings as summaries (count and sum, in seconds).
+        """
+        def metric_name(name):
+            return re.sub('[^a-zA-Z0-9]+', '_', name).strip('_')
+
+        counts, timings = self.snapshot()
+        lines = []
+        for name, value in sorted(counts.items()):
+            metric = '%s_%s_total' % (prefix, metric_name(name))
+            lines.extend(['# TYPE %s counter' % metric, '%s %s' % (metric, value)])
+        for name, timing in sorted(timings.items()):
+            metric = '%s_%s_seconds' % (prefix, metric_name(name))
+            lines.extend(['# TYPE %s summary' % metric, '%s_count %d' % (metric, timing.count),
+                          '%s_sum %r' % (metric, timing.total)])
+        return '\n'.join(lines) + '\n'
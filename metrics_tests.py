@@ -0,0 +1,49 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import unittest
+from metrics import InstrumentedStorage, MetricsCollector, Timing
+from storage import storage
+
+
+class MetricsCollectorTests(unittest.TestCase):
+    def test_collect(self):
+        collector = MetricsCollector()
+        collector.count('probes.terms')
+        collector.count('probes.terms', 2)
+        collector.timing('lookup', 0.5)
+        collector.timing('lookup', 0.25)
+        counts, timings = collector.snapshot()
+        self.assertDictEqual({'probes.terms': 3}, counts)
+        self.assertDictEqual({'lookup': Timing(2, 0.75, 0.25, 0.5)}, timings)
+        collector.timing('storage.__getitem__', 0.5)
+        self.assertEqual('# TYPE pyspell_probes_terms_total counter\n'
+                         'pyspell_probes_terms_total 3\n'
+                         '# TYPE pyspell_lookup_seconds summary\n'
+                         'pyspell_lookup_seconds_count 2\n'
+                         'pyspell_lookup_seconds_sum 0.75\n'
+                         '# TYPE pyspell_storage_getitem_seconds summary\n'
+                         'pyspell_storage_getitem_seconds_count 1\n'
+                         'pyspell_storage_getitem_seconds_sum 0.5\n', collector.exposition())
+        collector.snapshot(reset=True)
+        self.assertEqual(({}, {}), collector.snapshot())
+
+
+class InstrumentedStorageTests(unittest.TestCase):
+    def test_storage(self):
+        collector = MetricsCollector()
+        store = InstrumentedStorage(storage(None), collector)
+        store['t:ciao'] = 3
+        store.sadd('s:cao', u'caff\xe8')
+        self.assertIn('t:ciao', store)
+        self.assertEqual(3, store['t:ciao'])
+        self.assertSetEqual(set([u'caff\xe8']), store.smembers('s:cao'))
+        self.assertEqual(([3, None], [set([u'caff\xe8'])]), store.fetch_many(['t:ciao', 't:x'], ['s:cao']))
+        counts, timings = collector.snapshot()
+        self.assertDictEqual({'storage.bytes': 1 + 6 + 1 + 6}, counts)
+        self.assertSetEqual(set(['storage.__setitem__', 'storage.sadd', 'storage.__contains__', 'storage.__getitem__',
+                                 'storage.smembers', 'storage.fetch_many']), set(timings))
+        self.assertEqual(1, timings['storage.fetch_many'].count)
+
+
+if __name__ == '__main__':
+    unittest.main()
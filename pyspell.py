@@ -1,8 +1,21 @@
 __author__ = 'Simone Mainardi, simonemainardi@startmail.com'
 
 import codecs
+import copy
+import time
+from collections import Counter
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
 from word import Word
-from storage import storage
+from cache import LRUCache
+from text import Tokenizer, read_chunks
+from bloom import BloomFilter
+from costs import EditCosts
+from corrector import TextCorrector
+from snapshot import export, restore
+from metrics import InstrumentedStorage
+from storage import storage, MmapStorage
 
 
 def prepender(func):
@@ -19,27 +32,98 @@ def prepender(func):
     return prepend
 
 
+def index_deletes(words, edit_distance_max, best_suggestions_only=True, prefix_length=None):
+    """
+    Computes in memory the suggestions that adding every word in `words` would store for each delete.
+    The result maps each delete to a set of suggestions. When `best_suggestions_only` is True, only the
+    shortest suggestions are kept, consistently with what `SuggestTerms.__setitem__` does word by word.
+    Lengths are capped to `prefix_length`, if specified.
+    """
+    suggestions = dict()
+    for word in words:
+        word_len = min(len(word), prefix_length) if prefix_length is not None else len(word)
+        for delete in Word.prefix_deletes(word, edit_distance_max, prefix_length):
+            current = suggestions.get(delete)
+            if current is None:
+                suggestions[delete] = set([word])
+            elif not best_suggestions_only:
+                current.add(word)
+            else:
+                smallest_suggestion_len = len(next(iter(current)))
+                if prefix_length is not None:
+                    smallest_suggestion_len = min(smallest_suggestion_len, prefix_length)
+                if word_len < smallest_suggestion_len:
+                    suggestions[delete] = set([word])
+                elif word_len == smallest_suggestion_len:
+                    current.add(word)
+    return suggestions
+
+
+def _index_chunk(words, edit_distance_max, best_suggestions_only, prefix_length):
+    """
+    Returns the term counts and the deletes index of a chunk of words. Used by the worker processes
+    of `Dictionary.add_words_parallel`.
+    """
+    counts = Counter(words)
+    return counts, index_deletes(counts, edit_distance_max, best_suggestions_only, prefix_length)
+
+
+def _chunks(iterable, chunk_size):
+    iterable = iter(iterable)
+    while True:
+        chunk = list(islice(iterable, chunk_size))
+        if not chunk:
+            break
+        yield chunk
+
+
 class Terms(object):
-    def __init__(self, store=None):
+    def __init__(self, store=None, namespace=None):
+        """
+        If a `namespace` is specified, it is prepended to the prefix of the keys, so that several dictionaries
+        can share the same storage.
+        """
+        if namespace is not None:
+            if not namespace or ':' in namespace or '/' in namespace:
+                raise ValueError('namespace must be a non-empty string without colons and slashes.')
+            self._prefix = '%s/%s' % (namespace, self._prefix)
         self._items = store
 
+    def key(self, word):
+        """
+        Returns the storage key of `word`, i.e., `word` with the prefix
+        """
+        return self._prefix + word
+
+    def bind(self, store):
+        """
+        Returns a copy of these terms that reads and writes `store`.
+        """
+        terms = copy.copy(self)
+        terms._items = store
+        return terms
+
     @property
     def terms(self):
         """
         Returns all the terms we have stored without their prefix
         """
-        return [k[len(self._prefix):] for k in self._items.keys() if k.startswith(self._prefix)]
+        return [k[len(self._prefix):] for k in self._items.scan_iter(self._prefix)]
 
 
 class OriginalTerms(Terms):
     _prefix = 't:'  # this prefix stands for `term:`
 
-    @prepender
     def __setitem__(self, word, count):
+        self.add(word, count)
+
+    @prepender
+    def add(self, word, count):
         """
         Adds the `word` to the original terms. The number of occurrences is specified in `count`.
+        Returns the number of occurrences of `word`.
         """
-        self._items.incrby(word, count)
+        return self._items.incrby(word, count)
 
     @prepender
     def __getitem__(self, word):
@@ -48,89 +132,584 @@ class OriginalTerms(Terms):
         """
         return self._items[word] if word in self._items else 0
 
+    def update(self, counts):
+        """
+        Adds several words at once. `counts` maps each word to its number of occurrences.
+        Returns what the storage returns, i.e., the list of the new numbers of occurrences.
+        """
+        return self._items.incrby_many(dict((self.key(word), count) for word, count in counts.items()))
+
 
 class SuggestTerms(Terms):
     _prefix = 's:'  # this prefix stands for `suggestion:`
 
-    def __init__(self, store, best_suggestions_only=True):
+    def __init__(self, store, best_suggestions_only=True, prefix_length=None, full_postings=False, namespace=None):
+        """
+        When `full_postings` is True, every suggestion is stored, and only the best ones are returned
+        if `best_suggestions_only` is True.
+        """
         self._best_suggestions_only = best_suggestions_only
-        super(SuggestTerms, self).__init__(store)
+        self._prefix_length = prefix_length
+        self._full_postings = full_postings
+        self.pruned = best_suggestions_only and not full_postings  # whether only the best suggestions are stored
+        super(SuggestTerms, self).__init__(store, namespace)
+
+    def _len(self, suggestion):
+        """
+        Returns the length of `suggestion`, which is capped to the prefix length when deletes are
+        generated from prefixes
+        """
+        if self._prefix_length is None:
+            return len(suggestion)
+        return min(len(suggestion), self._prefix_length)
 
-    @prepender
     def __setitem__(self, delete, suggestion):
+        self.add(delete, suggestion)
+
+    @prepender
+    def add(self, delete, suggestion):
         """
-        Adds the `delete` term with the corresponding `suggestion`.
+        Adds the `delete` term with the corresponding `suggestion`. Returns True if `delete` is a new term.
         """
         # Damerau-Levenshtein distance can be trivially inferred since `delete` is obtained
         # by deleting one or more characters from suggestion.
         suggestions = self._items.smembers(delete)  # get currently existing suggestions
-        smallest_suggestion_len = len(min(suggestions, key=len)) if suggestions else len(suggestion)
-        if len(suggestion) < smallest_suggestion_len and self._best_suggestions_only:
+        smallest_suggestion_len = self._len(min(suggestions, key=len)) if suggestions else self._len(suggestion)
+        if self._len(suggestion) < smallest_suggestion_len and self.pruned:
             # if the new suggestion` has a smaller Damerau-Levenshtein distance from `delete`
             # we clear the already existing suggestions
             # The new `suggestion` has a smaller Damerau-Levenshtein distance if:
             # len(suggestion) - len(delete) < len(min(suggestions, key=len)) - len(delete)
             # if we simplify on len(delete) on both sides, we obtain the second condition in the above if statement.
             self._items.sclear(delete)
-        if not self._best_suggestions_only or len(suggestion) <= smallest_suggestion_len:
+        if not self.pruned or self._len(suggestion) <= smallest_suggestion_len:
             self._items.sadd(delete, suggestion)
+        return not suggestions
 
     @prepender
     def __getitem__(self, word):
-        return self._items.smembers(word)
+        return self.best(self._items.smembers(word))
+
+    def best(self, suggestions):
+        """
+        Returns the `suggestions` stored for a delete that are to be used for lookups: the shortest ones,
+        when every suggestion is stored but only the best ones are wanted.
+        """
+        if not self._best_suggestions_only or not self._full_postings or len(suggestions) < 2:
+            return suggestions
+        shortest = min(self._len(suggestion) for suggestion in suggestions)
+        return set(suggestion for suggestion in suggestions if self._len(suggestion) == shortest)
+
+    def update(self, suggestions):
+        """
+        Adds several deletes at once. `suggestions` maps each delete to a set of suggestions, as returned by
+        `index_deletes`. The outcome is the same as adding every suggestion one by one.
+        Returns what the storage returns, i.e., the number of new terms.
+        """
+        return self._items.sadd_many(dict((self.key(delete), words) for delete, words in suggestions.items()),
+                                      shortest_only=self.pruned, max_length=self._prefix_length)
+
+
+class PhoneticTerms(Terms):
+    _prefix = 'p:'  # this prefix stands for `phonetic:`
+
+    def __setitem__(self, key, word):
+        self.add(key, word)
+
+    @prepender
+    def add(self, key, word):
+        """
+        Adds `word` to the words whose phonetic key is `key`.
+        """
+        self._items.sadd(key, word)
+
+    @prepender
+    def __getitem__(self, key):
+        return self._items.smembers(key)
+
+    @staticmethod
+    def index(words):
+        """
+        Returns a dictionary that maps the phonetic key of each word in `words` to the set of words with that key.
+        """
+        keys = dict()
+        for word in words:
+            key = Word.phonetic_key(word)
+            if key:
+                keys.setdefault(key, set()).add(word)
+        return keys
+
+    def update(self, keys):
+        """
+        Adds several keys at once. `keys` maps each phonetic key to a set of words, as returned by `index`.
+        """
+        return self._items.sadd_many(dict((self.key(key), words) for key, words in keys.items()))
+
+
+class Statistics(Terms):
+    _prefix = 'n:'  # this prefix stands for `number of:`
+
+    def update(self, increments):
+        """
+        Increments several statistics at once. `increments` maps each statistic to its increment.
+        Returns what the storage returns.
+        """
+        return self._items.incrby_many(dict((self.key(name), incr) for name, incr in increments.items() if incr))
+
+    def fetch(self, names):
+        """
+        Returns a dictionary with the values of the statistics in `names`.
+        """
+        values = self._items.fetch_many([self.key(name) for name in names], [])[0]
+        return dict((name, int(value or 0)) for name, value in zip(names, values))
 
 
 class Dictionary(object):
-    def __init__(self, edit_distance_max=2, best_suggestions_only=True, storage_type=None, **kwargs):
-        store = storage(storage_type, **kwargs)
-        self._terms = OriginalTerms(store)
-        self._suggestions = SuggestTerms(store, best_suggestions_only)
+    VERBOSITIES = (None, 'top', 'closest', 'all')
+
+    def __init__(self, edit_distance_max=2, best_suggestions_only=True, storage_type=None, prefix_length=None,
+                 cache_size=0, cache_ttl=None, server_side_lookup=False, bloom_filter=None, keep_full_postings=False,
+                 namespace=None, observer=None, edit_costs=None, phonetic=False, store=None, **kwargs):
+        """
+        If `prefix_length` is specified, deletes are only generated from the first `prefix_length` characters
+        of each word. This shrinks the index considerably, at the cost of verifying more suggestions with the
+        Damerau-Levenshtein distance during lookups. It must be greater than `edit_distance_max`.
+
+        The dictionary is kept in a new storage of type `storage_type`, created with `kwargs`,
+        unless an existing storage object is passed as `store`. Several dictionaries (e.g., one per language)
+        can share the same storage object, and thus the same connections, if each one has its own `namespace`.
+        The number of terms and deletes of each dictionary are kept up to date in the storage (see `stats`).
+
+        With `storage_type='snapshot'` the dictionary can be shared by several threads: updates are serialized
+        and published atomically, while lookups never wait, since they read a snapshot of the storage.
+
+        If an `observer` is specified (see `metrics`), lookups report their counts and timings to it,
+        and the storage is wrapped so that it reports the latency of its calls.
+
+        If `edit_costs` (a `costs.EditCosts`, e.g., `costs.KeyboardCosts`) are specified, suggestions are ranked
+        by their weighted distance, i.e., the cost of the edits that turn the word looked up into them, which is
+        returned as their distance. If `phonetic` is True, the words are also indexed by their phonetic key
+        (see `Word.phonetic_key`), lookups also suggest the words that sound like the word looked up, and their
+        weighted distance is discounted (by unit edit costs, if no `edit_costs` are specified).
+
+        If `cache_size` is greater than zero, the results of the last `cache_size` distinct lookups are cached.
+        The cache is invalidated every time the dictionary is updated through this object. When other clients
+        update the same storage (e.g., the same Redis database), `cache_ttl` bounds the number of seconds a
+        cached result can be served for.
+
+        If `server_side_lookup` is True, `lookup` collects the candidate suggestions and their frequencies
+        with a script that runs on the storage, which is only supported by `RedisStorage`. Only the suggestions
+        that may be within `edit_distance_max` are transferred, and a lookup takes a single round trip.
+
+        If a `bloom.BloomFilter` is passed as `bloom_filter`, all the keys written to the storage are also added
+        to the filter, and lookups skip the keys that the filter reports as absent. It must only be used when
+        all the updates to the storage go through this object, and `save` persists it along with the dictionary.
+
+        Words can only be removed (see `remove_word`, `decrement` and `decay`) if the index keeps every
+        suggestion of each delete, i.e., if `best_suggestions_only` is False or `keep_full_postings` is True.
+        In the latter case the best suggestions are selected when the index is read, so lookups return the same
+        results, while the index takes more memory.
+        """
+        if prefix_length is not None and prefix_length <= edit_distance_max:
+            raise ValueError('prefix_length must be greater than edit_distance_max.')
+        if store is None:
+            store = storage(storage_type, **kwargs)
+        if observer is not None:
+            store = InstrumentedStorage(store, observer)
+        if server_side_lookup and not hasattr(store, 'suggest'):
+            raise ValueError('server_side_lookup is not supported by the storage.')
+        if server_side_lookup and best_suggestions_only and keep_full_postings:
+            raise ValueError('server_side_lookup is not supported with keep_full_postings.')
+        if server_side_lookup and phonetic:
+            raise ValueError('server_side_lookup is not supported with phonetic.')
+        self._store = store
+        self._terms = OriginalTerms(store, namespace)
+        self._suggestions = SuggestTerms(store, best_suggestions_only, prefix_length, keep_full_postings, namespace)
+        self._stats = Statistics(store, namespace)
+        self._phonetic = PhoneticTerms(store, namespace) if phonetic else None
         self.edit_distance_max = edit_distance_max
         self.best_suggestions_only = best_suggestions_only
+        self.prefix_length = prefix_length
+        self.keep_full_postings = keep_full_postings
+        self.namespace = namespace
+        self.edit_costs = edit_costs if edit_costs is not None or not phonetic else EditCosts()
+        self.phonetic = phonetic
+        self._observer = observer
+        self._cache = LRUCache(cache_size, cache_ttl) if cache_size else None
+        self.server_side_lookup = server_side_lookup
+        self._bloom = bloom_filter
+
+    def cache_info(self):
+        """
+        Returns the hits, misses, maximum and current size of the lookup cache, or None if there is no cache.
+        """
+        return self._cache.info() if self._cache is not None else None
+
+    def _updated(self):
+        if self._cache is not None:
+            self._cache.invalidate()
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of `terms` and `deletes` stored, and the total number of
+        `occurrences` of the terms. Statistics are updated along with the dictionary, so they don't require
+        scanning the storage.
+        """
+        return self._stats.fetch(['terms', 'deletes', 'occurrences'])
+
+    def recount_stats(self):
+        """
+        Recomputes the statistics by scanning the storage, e.g., for dictionaries created without statistics.
+        """
+        current = self.stats()
+        terms = self._terms.terms
+        counts = self._store.fetch_many([self._terms.key(term) for term in terms], [])[0]
+        self._stats.update({'terms': len(terms) - current['terms'],
+                            'deletes': len(self._suggestions.terms) - current['deletes'],
+                            'occurrences': sum(int(count or 0) for count in counts) - current['occurrences']})
+
+    @staticmethod
+    def _index_stats(counts, values, new_deletes):
+        """
+        Returns the increments of the statistics after `counts` have been added to the terms, whose numbers of
+        occurrences are now `values`, and `new_deletes` new deletes have been stored.
+        """
+        new_terms = sum(1 for count, value in zip(counts.values(), values) if int(value) == count)
+        return {'terms': new_terms, 'deletes': new_deletes, 'occurrences': sum(counts.values())}
 
     def add_word(self, word):
-        self._terms[word] = 1
-        for delete in Word.deletes(word, self.edit_distance_max):
-            self._suggestions[delete] = word
+        with self._store.transaction():
+            new_terms = int(self._terms.add(word, 1) == 1)
+            if self._bloom is not None:
+                self._bloom.add(self._terms.key(word))
+            new_deletes = 0
+            for delete in Word.prefix_deletes(word, self.edit_distance_max, self.prefix_length):
+                new_deletes += self._suggestions.add(delete, word)
+                if self._bloom is not None:
+                    self._bloom.add(self._suggestions.key(delete))
+            key = Word.phonetic_key(word) if self._phonetic is not None else None
+            if key:
+                self._phonetic.add(key, word)
+                if self._bloom is not None:
+                    self._bloom.add(self._phonetic.key(key))
+            self._stats.update({'terms': new_terms, 'deletes': new_deletes, 'occurrences': 1})
+        self._updated()
 
-    def add_words(self, words):
-        for word in words:
-            self.add_word(word)
+    def add_words(self, words, chunk_size=None):
+        """
+        Adds all the `words`. If `chunk_size` is specified, words are bulk loaded `chunk_size` at a time:
+        term frequencies and best suggestions are computed in memory for each chunk and then written to the
+        storage in a single batch. The resulting dictionary is the same as the one obtained adding words one by one.
+        """
+        if not chunk_size:
+            for word in words:
+                self.add_word(word)
+            return
+        for chunk in _chunks(words, chunk_size):
+            self._store_counts(Counter(chunk))
+
+    def add_words_parallel(self, words, processes=None, chunk_size=10000):
+        """
+        Adds all the `words` using a pool of `processes` worker processes (as many as the CPUs by default).
+        Words are split in chunks of `chunk_size` words. Workers compute the term counts and the deletes index
+        of each chunk, and chunks are merged into the storage in their original order. The resulting dictionary
+        is the same as the one obtained adding words one by one.
+        """
+        index_chunk = partial(_index_chunk, edit_distance_max=self.edit_distance_max,
+                              best_suggestions_only=self._suggestions.pruned, prefix_length=self.prefix_length)
+        pool = Pool(processes)
+        try:
+            for counts, suggestions in pool.imap(index_chunk, _chunks(words, chunk_size)):
+                self._store_index(counts, suggestions)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _store_index(self, counts, suggestions):
+        """
+        Merges term `counts` and deletes `suggestions`, computed with `index_deletes`, into the storage.
+        """
+        with self._store.transaction():
+            values = self._terms.update(counts)
+            new_deletes = self._suggestions.update(suggestions)
+            keys = PhoneticTerms.index(counts) if self._phonetic is not None else dict()
+            if keys:
+                self._phonetic.update(keys)
+            self._stats.update(self._index_stats(counts, values, new_deletes))
+            if self._bloom is not None:
+                for word in counts:
+                    self._bloom.add(self._terms.key(word))
+                for delete in suggestions:
+                    self._bloom.add(self._suggestions.key(delete))
+                for key in keys:
+                    self._bloom.add(self._phonetic.key(key))
+        self._updated()
 
-    def initialize(self, text):
+    def initialize(self, text, chunk_size=None):
         """ Initializes the dictionary using the `text` provided.
+        See `add_words` for the meaning of `chunk_size`.
         """
         with codecs.open(text, encoding='utf-8') as f:
-            for line in f:
-                word = line.strip()
-                self.add_word(word)
+            self.add_words((line.strip() for line in f), chunk_size=chunk_size)
+
+    def ingest(self, source, tokenizer=None, max_distinct=100000):
+        """
+        Adds all the words found in `source`, which can be the path of a UTF-8 encoded text file, a file-like
+        object or an iterable of strings. Text is read in chunks and split into words by `tokenizer`
+        (a `text.Tokenizer` that lowercases sequences of letters and digits by default).
+
+        Word occurrences are counted in memory, and each distinct word is added to the storage only once, with its
+        count. Counts are flushed to the storage whenever `max_distinct` distinct words have been seen, so memory
+        stays bounded, and the time needed depends on the size of the vocabulary rather than on the size of the text.
+        """
+        tokenizer = tokenizer or Tokenizer()
+        counts = Counter()
+        for token in tokenizer.iter_tokens(read_chunks(source)):
+            counts[token] += 1
+            if len(counts) >= max_distinct:
+                self._store_counts(counts)
+                counts = Counter()
+        if counts:
+            self._store_counts(counts)
+
+    def _store_counts(self, counts):
+        self._store_index(counts, index_deletes(counts, self.edit_distance_max, self._suggestions.pruned,
+                                                self.prefix_length))
+
+    def _check_removable(self):
+        if self._suggestions.pruned:
+            raise ValueError('Words can only be removed when all the suggestions are kept, '
+                             'see best_suggestions_only and keep_full_postings.')
+
+    def remove_word(self, word):
+        """
+        Removes `word` from the dictionary, whatever its number of occurrences.
+        """
+        self.remove_words([word])
+
+    def remove_words(self, words):
+        """
+        Removes all the `words` from the dictionary with one batch of writes. The deletes index is updated
+        so that the dictionary is the same as one where the `words` have never been added.
+        """
+        self._check_removable()
+        words = set(words)
+        members = dict()
+        for word in words:
+            for delete in Word.prefix_deletes(word, self.edit_distance_max, self.prefix_length):
+                members.setdefault(self._suggestions.key(delete), set()).add(word)
+        phonetic_members = dict()
+        if self._phonetic is not None:
+            phonetic_members = dict((self._phonetic.key(key), values)
+                                    for key, values in PhoneticTerms.index(words).items())
+        keys = [self._terms.key(word) for word in words]
+        with self._store.transaction():
+            occurrences = sum(max(int(count or 0), 0) for count in self._store.fetch_many(keys, [])[0])
+            removed_terms = self._store.delete_many(keys)
+            removed_deletes = self._store.srem_many(members)
+            if phonetic_members:
+                self._store.srem_many(phonetic_members)
+            self._stats.update({'terms': -removed_terms, 'deletes': -removed_deletes, 'occurrences': -occurrences})
+        self._updated()
+
+    def decrement(self, word, count=1):
+        """
+        Decrements the number of occurrences of `word` by `count`. The word is removed when no occurrences are
+        left. Returns the number of occurrences left.
+        """
+        self._check_removable()  # before writing anything
+        with self._store.transaction():
+            left = self._store.incrby(self._terms.key(word), -count)
+            if left == -count:  # `word` wasn't in the dictionary
+                self._store.delete_many([self._terms.key(word)])
+                return 0
+            if left <= 0:
+                self.remove_word(word)
+                self._stats.update({'occurrences': -(left + count)})
+                left = 0
+            else:
+                self._stats.update({'occurrences': -count})
+        self._updated()
+        return left
+
+    def decay(self, factor, min_count=1):
+        """
+        Multiplies the number of occurrences of every word by `factor` (rounding down), and removes the words
+        left with less than `min_count` occurrences, or with none. The counts of the words kept are updated with
+        increments, so concurrent additions to the same storage aren't lost, while the words removed are removed
+        with all their occurrences, including those added concurrently.
+        """
+        self._check_removable()
+        with self._store.transaction():
+            terms = self._terms.terms
+            counts = self._store.fetch_many([self._terms.key(term) for term in terms], [])[0]
+            increments, removed = dict(), []
+            for term, count in zip(terms, counts):
+                count = int(count or 0)
+                decayed = int(count * factor)
+                if decayed <= 0 or decayed < min_count:
+                    removed.append(term)
+                elif decayed != count:
+                    increments[self._terms.key(term)] = decayed - count
+            if increments:
+                self._store.incrby_many(increments)
+                self._stats.update({'occurrences': sum(increments.values())})
+            if removed:
+                self.remove_words(removed)
+        self._updated()
+
+    def save(self, path):
+        """
+        Saves the dictionary to the file at `path`. The file can be opened with `Dictionary.open`.
+        """
+        terms, deletes = self._terms.terms, self._suggestions.terms
+        counts, suggestions = self._store.fetch_many([self._terms.key(t) for t in terms],
+                                                     [self._suggestions.key(d) for d in deletes])
+        meta = {'edit_distance_max': self.edit_distance_max, 'best_suggestions_only': self.best_suggestions_only,
+                'prefix_length': self.prefix_length, 'keep_full_postings': self.keep_full_postings,
+                'namespace': self.namespace, 'phonetic': self.phonetic}
+        values = dict((self._terms.key(t), int(c)) for t, c in zip(terms, counts) if c)
+        sets = dict((self._suggestions.key(d), s) for d, s in zip(deletes, suggestions) if s)
+        stats = {'terms': len(values), 'deletes': len(sets), 'occurrences': sum(values.values())}
+        if self._phonetic is not None:
+            keys = self._phonetic.terms
+            sets.update((self._phonetic.key(k), s) for k, s in
+                        zip(keys, self._store.fetch_many([], [self._phonetic.key(k) for k in keys])[1]) if s)
+        values.update((self._stats.key(name), value) for name, value in stats.items())
+        MmapStorage.write(path, values, sets, meta,
+                          {'bloom': self._bloom.to_bytes()} if self._bloom is not None else None)
+
+    def export(self, path, include_index=False, batch_size=1000):
+        """
+        Writes a portable, compressed snapshot of the dictionary to `path`, possibly including the index of deletes,
+        and returns the number of terms and deletes written (see `snapshot.export`). Unlike `save`, it works with
+        any storage and the snapshot can be restored into any storage with `restore`.
+        """
+        return export(self, path, include_index, batch_size)
+
+    def restore(self, path, batch_size=1000):
+        """
+        Adds the terms of a snapshot written by `export` to the dictionary and returns the number of terms and
+        deletes read (see `snapshot.restore`).
+        """
+        return restore(self, path, batch_size)
 
-    def lookup(self, word, return_distances=False):
-        results = set()
+    @classmethod
+    def open(cls, path, edit_costs=None):
+        """
+        Opens a dictionary saved with `save`. The file is memory-mapped and lookups are served straight
+        from it, without loading it in memory. The returned dictionary is read-only. `edit_costs` aren't saved,
+        and can be specified again.
+        """
+        meta = MmapStorage.metadata(path)
+        store = MmapStorage(path)
+        bloom = store.section('bloom')
+        return cls(edit_distance_max=meta['edit_distance_max'], best_suggestions_only=meta['best_suggestions_only'],
+                   prefix_length=meta.get('prefix_length'), keep_full_postings=meta.get('keep_full_postings', False),
+                   namespace=meta.get('namespace'), phonetic=meta.get('phonetic', False), edit_costs=edit_costs,
+                   store=store,
+                   bloom_filter=BloomFilter.from_bytes(bloom) if bloom is not None else None)
+
+    def _candidates(self, word):
+        """
+        Returns the candidates to be probed in the storage when looking up `word`, i.e., `word` itself
+        and its deletes, as tuples (candidate, candidate_distance) sorted by increasing distance.
+        When deletes are generated from prefixes, the distance of some candidates from `word` may exceed
+        `edit_distance_max`.
+        """
         candidates = set([(word, 0)])  # a set of tuples (candidate, candidate_distance)
-        for delete in Word.deletes(word, self.edit_distance_max):
+        for delete in Word.prefix_deletes(word, self.edit_distance_max, self.prefix_length):
             delete_distance = len(word) - len(delete)
             candidates.update([(delete, delete_distance)])
-        candidates = sorted(candidates, key=lambda x: x[1])  # sort by increasing distance
-        while candidates:
-            candidate, candidate_distance = candidates.pop()  # the distance of the candidate from `word`
-            candidate_count = self._terms[candidate]  # the (possibly 0) no. of occurrences for candidate
-            if candidate_count > 0:  # there is an entry for this item in the dictionary
+        if self._observer is not None:
+            self._observer.count('deletes', len(candidates) - 1)
+        return sorted(candidates, key=lambda x: x[1])  # sort by increasing distance
+
+    def _resolve(self, word, candidates, counts, suggestions):
+        """
+        Returns the set of tuples (result, distance) found for `word` among its `candidates`.
+        `counts` and `suggestions` are functions returning, respectively, the number of occurrences
+        and the suggestions of a candidate.
+        Suggestions whose distance can't be inferred are collected and verified in a single batch. When
+        `edit_costs` are set, distances are weighted, and no distance other than 0 is inferred.
+        """
+        weighted = self.edit_costs is not None
+        results = dict()  # result -> distance
+        pending = set()  # suggestions whose distance from `word` has to be computed
+        for candidate, candidate_distance in reversed(candidates):  # the distance of the candidate from `word`
+            if candidate_distance <= self.edit_distance_max and counts(candidate) > 0:
+                # there is an entry for this item in the dictionary
                 #  candidate is an original word!
-                results.update([(candidate, candidate_distance)])
-            suggestions = self._suggestions[candidate]  # the (possibly not existing) suggestions for candidate
-            for suggestion in suggestions:
-                if not suggestion in [r[0] for r in results]:  # the sugg. exists and hasn't been found yet
-                    if suggestion == word:  # suggestion _is_ the word we are looking for
-                        real_distance = 0
-                    elif candidate_distance == 0:  # candidate _is_ the word we are looking up for
-                        real_distance = len(suggestion) - len(candidate)  # suggestion_distance
-                    else:  # candidate is a delete edit of the word we are looking up for
-                        real_distance = Word.damerau_levenshtein_distance(word, suggestion)
+                if weighted and candidate_distance:
+                    pending.add(candidate)
+                else:
+                    results[candidate] = candidate_distance
+            for suggestion in suggestions(candidate):  # the (possibly not existing) suggestions for candidate
+                if suggestion in results:  # the sugg. has already been found
+                    continue
+                if suggestion == word:  # suggestion _is_ the word we are looking for
+                    results[suggestion] = 0
+                elif candidate_distance == 0 and not weighted:  # candidate _is_ the word we are looking up for
+                    real_distance = len(suggestion) - len(candidate)  # suggestion_distance
                     if real_distance <= self.edit_distance_max:
-                        results.update([(suggestion, real_distance)])
+                        results[suggestion] = real_distance
+                else:  # candidate is a delete edit of the word we are looking up for
+                    pending.add(suggestion)
+        pending = [suggestion for suggestion in pending if suggestion not in results]
+        if self._observer is not None:
+            self._observer.count('distances', len(pending))
+        for suggestion, real_distance in zip(pending, self._distances(word, pending)):
+            if real_distance <= self.edit_distance_max:
+                results[suggestion] = real_distance
+        return set(results.items())
+
+    def _distances(self, word, others):
+        """
+        Returns the bounded Damerau-Levenshtein distances between `word` and each word in `others`. When
+        `edit_costs` are set, the distances within `edit_distance_max` are then weighted, with the same bound.
+        """
+        distances = Word.damerau_levenshtein_distances(word, others, self.edit_distance_max)
+        if self.edit_costs is None:
+            return distances
+        return [Word.weighted_distance(word, other, self.edit_costs, self.edit_distance_max)
+                if distance <= self.edit_distance_max else distance for other, distance in zip(others, distances)]
+
+    def _weigh(self, word, results, matches=()):
+        """
+        Returns the `results` of a lookup of `word`, tuples (result, distance) with distances weighted by
+        `edit_costs`, together with the phonetic `matches` of `word` within `edit_distance_max`. When words are
+        indexed by their phonetic key, the weighted distances of the results that sound like `word` are
+        discounted. Counts aren't needed, so weighing doesn't access the storage.
+        """
+        costs = self.edit_costs
+        key = Word.phonetic_key(word) if self.phonetic else None
+        results = dict(results)
+        matches = [match for match in matches if match not in results]
+        if self._observer is not None:
+            self._observer.count('distances', len(matches))
+        for match in matches:  # matches sound like `word`, but their distance is unknown
+            results[match] = Word.weighted_distance(word, match, costs, self.edit_distance_max / costs.phonetic)
+        weighted = set()
+        for result, distance in results.items():
+            if distance == 0:
+                weighted.add((result, 0))
+                continue
+            discount = costs.phonetic if key and Word.phonetic_key(result) == key else 1
+            if distance * discount <= self.edit_distance_max:
+                weighted.add((result, round(distance * discount, 6)))
+        return weighted
+
+    def _rank(self, results, counts, return_distances, top_k=None, verbosity=None):
+        """
+        Sorts the `results` of a lookup and possibly keeps only the best ones.
+        `counts` is a function returning the number of occurrences of a result.
+        `top_k` and `verbosity` are as in `lookup`.
+        """
+        if top_k is not None or verbosity is not None:
+            ranked = sorted(list(results), key=lambda r: (r[1], -counts(r[0])))
+            return self._select(ranked, top_k, verbosity, return_distances)
         # sort the results first by increasing distance, then by decreasing frequency
-        results = sorted(list(results), key=lambda r: (r[1], -self._terms[r[0]]))
+        results = sorted(list(results), key=lambda r: (r[1], -counts(r[0])))
         if self.best_suggestions_only and len(results) > 1:
             # only take the original word (if present) and the suggestions with minimum distance from `word`
             min_index = 0 if results[0][1] != 0 else 1  # possibly exclude `word` from the minimum distance
@@ -140,6 +719,331 @@ class Dictionary(object):
             results = [r[0] for r in results]  # pop out the distances and keep only the suggestions
         return results
 
+    def _search(self, word, candidates, counts, suggestions, top_k=None, closest=False):
+        """
+        Returns the list of tuples (result, distance) found for `word` among its `candidates`, sorted by increasing
+        distance and decreasing frequency. `counts` and `suggestions` are as in `_resolve`, and `counts` is
+        called once per word at most.
+
+        Candidates are processed in order of increasing number of deletes. Once the candidates with `j` deletes
+        have been processed, every result within distance `j` has been found, so the search stops as soon as
+        there are `top_k` results within distance `j` or, if `closest` is True, as soon as a result within
+        distance `j` has been found.
+        """
+        memo = dict()
+
+        def count(w):
+            if w not in memo:
+                memo[w] = counts(w)
+            return memo[w]
+
+        # deletes of a prefix lack the characters after the prefix, which are not deletes from the prefix
+        overflow = len(word) - min(len(word), self.prefix_length) if self.prefix_length is not None else 0
+        results = dict()  # result -> distance
+        ranked = []
+        i = 0
+        while i < len(candidates):
+            level = max(candidates[i][1] - overflow, 0)
+            pending = set()
+            while i < len(candidates) and max(candidates[i][1] - overflow, 0) == level:
+                candidate, candidate_distance = candidates[i]
+                i += 1
+                if candidate_distance <= self.edit_distance_max and count(candidate) > 0:
+                    results[candidate] = candidate_distance
+                for suggestion in suggestions(candidate):
+                    if suggestion in results:
+                        continue
+                    if suggestion == word:
+                        results[suggestion] = 0
+                    elif candidate_distance == 0:
+                        if len(suggestion) - len(candidate) <= self.edit_distance_max:
+                            results[suggestion] = len(suggestion) - len(candidate)
+                    else:
+                        pending.add(suggestion)
+            pending = [suggestion for suggestion in pending if suggestion not in results]
+            if self._observer is not None:
+                self._observer.count('distances', len(pending))
+            distances = Word.damerau_levenshtein_distances(word, pending, self.edit_distance_max)
+            for suggestion, real_distance in zip(pending, distances):
+                if real_distance <= self.edit_distance_max:
+                    results[suggestion] = real_distance
+            ranked = sorted(results.items(), key=lambda r: (r[1], -count(r[0])))
+            if closest and ranked and ranked[0][1] <= level:
+                break
+            if top_k is not None and len(ranked) >= top_k and ranked[top_k - 1][1] <= level:
+                break
+        return ranked
+
+    def _select(self, ranked, top_k, verbosity, return_distances):
+        """
+        Selects the results to return among the `ranked` results of a lookup, sorted as returned by `_search`.
+        """
+        if verbosity == 'top':
+            ranked = ranked[:1]
+        elif verbosity == 'closest':
+            ranked = [r for r in ranked if r[1] == ranked[0][1]]
+        if top_k is not None:
+            ranked = ranked[:top_k]
+        if not return_distances:
+            ranked = [r[0] for r in ranked]
+        return ranked
+
+    def _fetch(self, words, keys=(), store=None):
+        """
+        Fetches the number of occurrences and the suggestions of all the `words`, and the words with the phonetic
+        `keys`, with a single batch of `store` (the storage of the dictionary by default). Returns three
+        dictionaries keyed by word, word and key.
+        """
+        words, keys = list(words), list(keys)
+        term_words, delete_words = words, words
+        if self._bloom is not None:
+            term_words = [w for w in words if self._terms.key(w) in self._bloom]
+            delete_words = [w for w in words if self._suggestions.key(w) in self._bloom]
+            keys = [key for key in keys if self._phonetic.key(key) in self._bloom]
+        values, sets = (store or self._store).fetch_many([self._terms.key(w) for w in term_words],
+                                                         [self._suggestions.key(w) for w in delete_words] +
+                                                         [self._phonetic.key(key) for key in keys])
+        phonetic = dict(zip(keys, sets[len(delete_words):]))
+        sets = sets[:len(delete_words)]
+        if self._observer is not None:
+            for kind, fetched in (('terms', values), ('suggestions', sets)):
+                hits = sum(1 for value in fetched if value)
+                self._observer.count('probes.' + kind, len(fetched))
+                self._observer.count('hits.' + kind, hits)
+                self._observer.count('misses.' + kind, len(fetched) - hits)
+        if self._bloom is None:
+            return self._fetched(words, values, sets) + (phonetic,)
+        counts, suggestions = self._fetched(words, [None] * len(words), [set()] * len(words))
+        counts.update(self._fetched(term_words, values, [])[0])
+        suggestions.update(self._fetched(delete_words, [], sets)[1])
+        return counts, suggestions, phonetic
+
+    def _fetched(self, words, values, sets):
+        """
+        Returns the dictionaries returned by `_fetch`, given the `values` and the `sets` fetched for `words`.
+        """
+        return dict(zip(words, [int(v) if v else 0 for v in values])), \
+            dict(zip(words, [self._suggestions.best(s) for s in sets]))
+
+    def lookup(self, word, return_distances=False, top_k=None, verbosity=None):
+        """
+        Returns the suggestions for `word`, sorted by increasing distance and decreasing frequency, possibly
+        paired with their distances if `return_distances` is True.
+
+        By default, all the suggestions within `edit_distance_max` are returned, or only the original word and
+        the closest ones when `best_suggestions_only` is True. `verbosity` can be one of:
+        - 'top': only the best suggestion;
+        - 'closest': only the suggestions with the smallest distance;
+        - 'all': all the suggestions within `edit_distance_max`.
+        and, if `top_k` is specified, at most the `top_k` best suggestions are returned.
+
+        When `top_k` or `verbosity` are specified, the candidates are processed in order of increasing distance
+        and the lookup stops as soon as no other suggestion can rank higher than those already found. The
+        frequency of each suggestion is read once. When `best_suggestions_only` is True, the index doesn't keep
+        every suggestion, and results may differ from those of a full scan of the candidates.
+        """
+        if verbosity not in self.VERBOSITIES:
+            raise ValueError('verbosity must be one of %s.' % ', '.join(v for v in self.VERBOSITIES if v))
+        if top_k is not None and top_k < 1:
+            raise ValueError('top_k must be greater than zero.')
+        if self._observer is None:
+            return self._lookup(word, return_distances, top_k, verbosity)
+        start = time.time()
+        results = self._lookup(word, return_distances, top_k, verbosity)
+        self._observer.timing('lookup', time.time() - start)
+        self._observer.count('results', len(results))
+        return results
+
+    def _lookup(self, word, return_distances, top_k, verbosity):
+        if self._cache is not None:
+            key = (word, return_distances, top_k, verbosity)
+            cached = self._cache.get(key)
+            if cached is not None:
+                return list(cached)
+            generation = self._cache.generation
+        if self.server_side_lookup:
+            results = self._lookup_server_side(word, return_distances, top_k, verbosity)
+        elif self.edit_costs is not None:
+            # phonetic matches are fetched with the candidates, and the counts of all the results with a
+            # second batch, rather than with a read per result
+            snapshot = getattr(self._store, 'snapshot', None)
+            results = self._run(self._lookup_many([word], return_distances, top_k, verbosity),
+                                snapshot() if snapshot is not None else None)[0]
+        else:
+            terms, suggestion_terms = self._readers()
+            counts, suggestions = terms.__getitem__, suggestion_terms.__getitem__
+            if self._observer is not None:
+                counts, suggestions = self._observed(counts, 'terms'), self._observed(suggestions, 'suggestions')
+            if self._bloom is not None:
+                counts, suggestions = self._filtered(counts, terms, 0), \
+                    self._filtered(suggestions, suggestion_terms, set())
+            counts = self._memoized(counts)  # ranking reuses the counts read while resolving the candidates
+            if top_k is None and verbosity is None:
+                results = self._resolve(word, self._candidates(word), counts, suggestions)
+                results = self._rank(results, counts, return_distances)
+            else:
+                ranked = self._search(word, self._candidates(word), counts, suggestions, top_k=top_k,
+                                      closest=verbosity in ('top', 'closest'))
+                results = self._select(ranked, top_k, verbosity, return_distances)
+        if self._cache is not None:
+            self._cache.put(key, tuple(results), generation)
+        return results
+
+    def _readers(self):
+        """
+        Returns the terms and the suggestions read by a lookup. If the storage supports snapshots, they read
+        a snapshot, so that the lookup isn't affected by concurrent updates.
+        """
+        snapshot = getattr(self._store, 'snapshot', None)
+        if snapshot is None:
+            return self._terms, self._suggestions
+        view = snapshot()
+        return self._terms.bind(view), self._suggestions.bind(view)
+
+    @staticmethod
+    def _memoized(get):
+        """
+        Returns a function that calls `get` once per word.
+        """
+        memo = dict()
+
+        def memoized(word):
+            if word not in memo:
+                memo[word] = get(word)
+            return memo[word]
+        return memoized
+
+    def _observed(self, get, kind):
+        """
+        Returns a function that calls `get` and reports the probe of a key of `kind`, and whether it was found.
+        """
+        observer = self._observer
+
+        def observed(word):
+            value = get(word)
+            observer.count('probes.' + kind)
+            observer.count(('hits.' if value else 'misses.') + kind)
+            return value
+        return observed
+
+    def _filtered(self, get, terms, absent):
+        """
+        Returns a function that calls `get` for the words whose key in `terms` may be in the Bloom filter,
+        and returns `absent` for the others.
+        """
+        bloom, key = self._bloom, terms.key
+
+        def filtered(word):
+            return get(word) if key(word) in bloom else absent
+        return filtered
+
+    def _lookup_server_side(self, word, return_distances, top_k=None, verbosity=None):
+        """
+        Carries out `lookup` with the storage `suggest` script. Results are the same, since the distance of
+        each suggestion is computed anyway (distances inferred from lengths are Damerau-Levenshtein distances).
+        """
+        candidates = self._candidates(word)
+        values, suggestions = self._store.suggest([self._terms.key(c) for c, _ in candidates],
+                                                  [self._suggestions.key(c) for c, _ in candidates],
+                                                  self._terms.key(''), len(word), self.edit_distance_max)
+        counts = dict((candidate, count) for (candidate, _), count in zip(candidates, values))
+        if self._observer is not None:
+            hits = sum(1 for count in values if count > 0)
+            for name, value in (('probes.terms', len(values)), ('hits.terms', hits),
+                                ('misses.terms', len(values) - hits), ('probes.suggestions', len(candidates))):
+                self._observer.count(name, value)
+        results = set((candidate, distance) for candidate, distance in candidates
+                      if distance <= self.edit_distance_max and counts[candidate] > 0)
+        found = set(r[0] for r in results)
+        pending = [suggestion for suggestion in suggestions if suggestion not in found]
+        if self.edit_costs is not None:  # the distances of the candidates found are weighted too
+            pending.extend(r[0] for r in results if r[1])
+            results = set(r for r in results if not r[1])
+        if self._observer is not None:
+            self._observer.count('distances', len(pending))
+        for suggestion, distance in zip(pending, self._distances(word, pending)):
+            if distance <= self.edit_distance_max:
+                results.add((suggestion, distance))
+        counts.update(suggestions)
+        if self.edit_costs is not None:
+            results = self._weigh(word, results)
+        return self._rank(results, counts.__getitem__, return_distances, top_k, verbosity)
+
+    def frequencies(self, words):
+        """
+        Returns a dictionary with the number of occurrences of each of the `words`, 0 if unknown, fetched with a
+        single storage batch. Suggestions aren't fetched.
+        """
+        words = list(words)
+        fetched = words
+        if self._bloom is not None:
+            fetched = [w for w in words if self._terms.key(w) in self._bloom]
+        values = self._store.fetch_many([self._terms.key(w) for w in fetched], [])[0]
+        if self._observer is not None:
+            hits = sum(1 for value in values if value)
+            for name, value in (('probes.terms', len(values)), ('hits.terms', hits),
+                                ('misses.terms', len(values) - hits)):
+                self._observer.count(name, value)
+        counts = dict.fromkeys(words, 0)
+        counts.update(self._fetched(fetched, values, [])[0])
+        return counts
+
+    def correct_text(self, text, tokenizer=None, batch_size=1000):
+        """
+        Corrects a whole `text` and returns a tuple with the corrected text and the list of the corrections made,
+        as `corrector.Correction` tuples (start, end, original, replacement) where `start` and `end` are offsets
+        in `text`. Besides misspelled words, run-together words are split and split words are merged
+        (see `corrector.TextCorrector`).
+        """
+        return TextCorrector(self, tokenizer=tokenizer, batch_size=batch_size).correct(text)
+
+    def lookup_many(self, words, return_distances=False):
+        """
+        Looks up several `words` at once and returns the list of their results, in the same order as `words`.
+        Results are the same that `lookup` would return for each word. However, the storage is accessed
+        in two batches only: one for the candidates of all the words and one for the frequencies of
+        the suggestions found.
+        """
+        start = time.time()
+        results = self._run(self._lookup_many(words, return_distances))
+        if self._observer is not None:
+            self._observer.timing('lookup_many', time.time() - start)
+            self._observer.count('results', sum(len(res) for res in results))
+        return results
+
+    def _run(self, steps, store=None):
+        """
+        Runs `steps`, a generator as returned by `_lookup_many`, fetching from `store` (the storage of the
+        dictionary by default), and returns its results.
+        """
+        try:
+            request = next(steps)
+            while True:
+                request = steps.send(self._fetch(*request, store=store))
+        except StopIteration as e:
+            return e.value
+
+    def _lookup_many(self, words, return_distances, top_k=None, verbosity=None):
+        """
+        Carries out `lookup_many` without accessing the storage. This generator yields the arguments of
+        `_fetch`, i.e., the lists of the words and of the phonetic keys to be fetched, expects to be sent the
+        result of the fetch, and returns the results. `top_k` and `verbosity` are as in `lookup`.
+        """
+        words = list(words)
+        candidates = dict((word, self._candidates(word)) for word in set(words))
+        keys = dict((word, Word.phonetic_key(word)) for word in candidates) if self._phonetic is not None else {}
+        counts, suggestions, phonetic = yield (list(set(c for cands in candidates.values() for c, _ in cands)),
+                                               list(set(key for key in keys.values() if key)))
+        results = dict((word, self._resolve(word, cands, counts.__getitem__, suggestions.__getitem__))
+                       for word, cands in candidates.items())
+        if self.edit_costs is not None:
+            results = dict((word, self._weigh(word, res, phonetic.get(keys.get(word), ())))
+                           for word, res in results.items())
+        missing = set(r[0] for res in results.values() for r in res).difference(counts)
+        if missing:
+            counts.update((yield (list(missing), []))[0])
+        return [self._rank(results[word], counts.__getitem__, return_distances, top_k, verbosity) for word in words]
+
 
 if __name__ == '__main__':
     pass
@@ -1,8 +1,18 @@
 __author__ = 'Simone Mainardi, simonemainardi@startmail.com'
 
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
 import unittest
 from storage import storage
 from pyspell import OriginalTerms, SuggestTerms, Dictionary, Word
+from bloom import BloomFilter
+from metrics import MetricsCollector
+from costs import KeyboardCosts
 
 redis_host = 'localhost'
 redis_port = 6379
@@ -48,12 +58,27 @@ class TestTermsRedis(TermsTests):
         storage('redis', flush_db=True, host=redis_host, port=redis_port, db=redis_db)
 
 
+def keyspace(d):
+    """
+    Returns the terms and the suggestions stored in dictionary `d`
+    """
+    terms = dict((term, int(d._terms[term])) for term in d._terms.terms)
+    suggestions = dict((delete, d._suggestions[delete]) for delete in d._suggestions.terms)
+    return terms, dict((delete, sugg) for delete, sugg in suggestions.items() if sugg)
+
+
 class DictionaryTests(unittest.TestCase):
     def setUp(self):
         self.d = Dictionary()
         self.d_all = Dictionary(best_suggestions_only=False)
         self.words = DictionaryTests.some_words()
 
+    def other_dictionary(self, **kwargs):
+        """
+        Returns a dictionary that doesn't share its storage with `self.d`
+        """
+        return Dictionary(**kwargs)
+
     @staticmethod
     def some_words():
         words = ['orange', 'prange', 'rng']
@@ -119,14 +144,437 @@ class DictionaryTests(unittest.TestCase):
         self.assertListEqual(['simone', 'simon'], self.d.lookup('simone'))
 
 
+    def test_lookup_many(self):
+        self.d.add_words(['apl', 'aple', 'apple', 'applex', 'orange', 'rnge', 'simone', 'simon', 'simon'])
+        words = ['apple', 'aplpe', 'orang', 'simo', 'simo', 'xyz', 'rn']
+        for return_distances in (False, True):
+            self.assertListEqual([self.d.lookup(word, return_distances) for word in words],
+                                 self.d.lookup_many(words, return_distances))
+        self.assertListEqual([], self.d.lookup_many([]))
+
+    def test_correct_text(self):
+        self.d.add_words(['new', 'york', 'new', 'york', 'city', 'mountains'])
+        self.assertDictEqual({'new': 2, 'city': 1, 'newyork': 0}, self.d.frequencies(['new', 'city', 'newyork']))
+        self.assertEqual('New york city mountains', self.d.correct_text('Newyork cty mou ntains')[0])
+
+    def test_lookup_top_k(self):
+        d = self.other_dictionary(best_suggestions_only=False)
+        d.add_words(['apl', 'apl', 'aple', 'apple', 'apple', 'apple', 'applex', 'ample', 'orange', 'rnge', 'simone',
+                     'simon', 'simon', 'sim'])
+        for word in ['apple', 'aplpe', 'aple', 'orang', 'simo', 'xyz', 'rn']:
+            everything = d.lookup(word, True, verbosity='all')
+            self.assertListEqual(sorted(d.lookup(word, True)), sorted(everything))
+            for top_k in (1, 2, 3):
+                self.assertListEqual(everything[:top_k], d.lookup(word, True, top_k=top_k))
+            self.assertListEqual(everything[:1], d.lookup(word, True, verbosity='top'))
+            self.assertListEqual([r for r in everything if r[1] == everything[0][1]],
+                                 d.lookup(word, True, verbosity='closest'))
+        self.assertListEqual(['aple', 'apple', 'apl', 'ample', 'applex'], d.lookup('aple', verbosity='all'))
+        self.assertListEqual(['aple', 'apple'], d.lookup('aple', top_k=2))
+        self.assertListEqual(['simon'], d.lookup('simo', verbosity='top'))
+        self.assertListEqual(['simon', 'sim'], d.lookup('simo', verbosity='closest'))
+        self.assertRaises(ValueError, lambda: d.lookup('simo', verbosity='some'))
+        self.assertRaises(ValueError, lambda: d.lookup('simo', top_k=0))
+
+    def test_remove_word(self):
+        words = ['apl', 'aple', 'apple', 'applex', 'ample', 'orange', 'rnge', 'simone', 'simon', 'simon', 'sim']
+        removed = ['apl', 'simon', 'rnge', 'missing']
+        left = [word for word in words if word not in removed]
+        queries = words + ['aplpe', 'orang', 'simo', 'xyz', 'rn']
+        for best_suggestions_only in (True, False):
+            d = self.other_dictionary(best_suggestions_only=best_suggestions_only, keep_full_postings=True)
+            d.add_words(words)
+            expected = self.other_dictionary(best_suggestions_only=best_suggestions_only)
+            expected.add_words(words)
+            for word in queries:
+                self.assertListEqual(sorted(expected.lookup(word, True)), sorted(d.lookup(word, True)))
+            for word in removed:
+                d.remove_word(word)
+            expected = self.other_dictionary(best_suggestions_only=best_suggestions_only, keep_full_postings=True)
+            expected.add_words(left)
+            self.assertEqual(keyspace(expected), keyspace(d))
+            self.assertEqual(sorted(expected._store.keys()), sorted(d._store.keys()))  # no empty sets left
+            expected = self.other_dictionary(best_suggestions_only=best_suggestions_only)
+            expected.add_words(left)
+            for word in queries:
+                self.assertListEqual(sorted(expected.lookup(word, True)), sorted(d.lookup(word, True)))
+        self.assertRaises(ValueError, lambda: self.d.remove_word('apl'))
+
+    def test_decrement_decay(self):
+        d = self.other_dictionary(keep_full_postings=True, cache_size=10)
+        d.add_words(['simone', 'simon', 'simon', 'simon', 'sim', 'sim'])
+        self.assertListEqual(['simon', 'sim'], d.lookup('simo'))
+        self.assertEqual(2, d.decrement('simon'))
+        self.assertEqual(0, d.decrement('simon', 5))
+        self.assertListEqual(['sim'], d.lookup('simo'))
+        d.add_words(['simon'] * 4 + ['simone'] * 2)
+        d.decay(0.5, min_count=2)
+        expected = self.other_dictionary(keep_full_postings=True)
+        expected.add_words(['simon', 'simon'])  # simone and sim are left with 1 occurrence
+        self.assertEqual(keyspace(expected), keyspace(d))
+        self.assertListEqual(['simon'], d.lookup('simo'))
+        # words decayed to no occurrences are removed whatever min_count is
+        d.add_words(['sim'] * 10)
+        d.decay(0.1, min_count=0)
+        expected = self.other_dictionary(keep_full_postings=True)
+        expected.add_word('sim')
+        self.assertEqual(keyspace(expected), keyspace(d))
+        self.assertDictEqual(expected.stats(), d.stats())
+        self.assertListEqual(['sim'], d.lookup('simo'))
+        self.assertRaises(ValueError, lambda: self.d.decrement('simon'))
+        self.assertRaises(ValueError, lambda: self.d.decay(0.5))
+
+    def test_namespaces(self):
+        store = self.d._store
+        en = Dictionary(namespace='en', store=store)
+        it = Dictionary(namespace='it', store=store, keep_full_postings=True)
+        self.d.add_words(['simon', 'simone'])
+        en.add_words(['apple', 'aple', 'apple', 'circumstance'], chunk_size=2)
+        it.add_word('mela')
+        it.add_word('mela')
+        it.add_word('circostanza')
+        self.assertListEqual(['simon'], self.d.lookup('simo'))
+        self.assertListEqual([], en.lookup('simo'))
+        self.assertListEqual(['apple', 'aple'], en.lookup('aplpe'))
+        self.assertListEqual([], it.lookup('aplpe'))
+        self.assertListEqual(['mela'], it.lookup('mel'))
+        self.assertListEqual([['mela'], ['circostanza']], it.lookup_many(['mel', 'circostamza']))
+        for d, occurrences in ((self.d, 2), (en, 4), (it, 3)):
+            terms, suggestions = keyspace(d)
+            self.assertDictEqual({'terms': len(terms), 'deletes': len(suggestions), 'occurrences': occurrences},
+                                 d.stats())
+        self.assertSetEqual(set(['mela', 'circostanza']), set(it._terms.terms))
+        it.remove_word('mela')
+        self.assertDictEqual({'terms': 1, 'deletes': len(keyspace(it)[1]), 'occurrences': 1}, it.stats())
+        self.assertEqual(0, it.decrement('missing'))
+        self.assertEqual(1, it.stats()['terms'])
+        self.assertDictEqual({'terms': 2, 'deletes': len(keyspace(self.d)[1]), 'occurrences': 2}, self.d.stats())
+        for stats in (self.d._stats, en._stats, it._stats):
+            store.delete_many([stats.key('terms'), stats.key('deletes'), stats.key('occurrences')])
+        en.recount_stats()
+        self.assertDictEqual({'terms': 3, 'deletes': len(keyspace(en)[1]), 'occurrences': 4}, en.stats())
+        for namespace in ('', 'en:us', 'en/us'):
+            self.assertRaises(ValueError, lambda: Dictionary(namespace=namespace, store=store))
+
+    def test_observer(self):
+        words = ['apl', 'aple', 'apple', 'applex', 'orange', 'rnge', 'simone', 'simon', 'simon']
+        collector = MetricsCollector()
+        d = self.other_dictionary(observer=collector)
+        d.add_words(words)
+        collector.snapshot(reset=True)
+        self.assertListEqual(['aple', 'apple'], sorted(d.lookup('aplpe')))
+        counts, timings = collector.snapshot(reset=True)
+        candidates = len(Word.deletes('aplpe', 2)) + 1
+        self.assertEqual(candidates - 1, counts['deletes'])
+        self.assertEqual(candidates, counts['probes.suggestions'])
+        self.assertGreaterEqual(counts['probes.terms'], candidates)  # results are ranked by their frequency
+        for kind in ('terms', 'suggestions'):
+            self.assertEqual(counts['probes.' + kind], counts['hits.' + kind] + counts['misses.' + kind])
+        self.assertEqual(2, counts['results'])
+        self.assertGreater(counts['distances'], 0)
+        self.assertGreater(counts['storage.bytes'], 0)
+        self.assertEqual(1, timings['lookup'].count)
+        self.assertIn('storage.smembers', timings)
+        queries = ['aplpe', 'simo', 'xyz']
+        self.assertListEqual([d.lookup(word) for word in queries], d.lookup_many(queries))
+        counts, timings = collector.snapshot()
+        self.assertEqual(1, timings['lookup_many'].count)
+        self.assertEqual(counts['probes.terms'], counts['hits.terms'] + counts['misses.terms'])
+
+    def test_add_words_parallel(self):
+        words = self.words * 3 + ['ciao', 'ciaoB', 'miao', 'simone', 'simon', 'aple', 'watermelon', 'wassermelon']
+        for best_suggestions_only in (True, False):
+            expected = self.other_dictionary(best_suggestions_only=best_suggestions_only)
+            expected.add_words(words)
+            d = self.other_dictionary(best_suggestions_only=best_suggestions_only)
+            d.add_words_parallel(words, processes=2, chunk_size=5)
+            self.assertEqual(keyspace(expected), keyspace(d))
+
+    def test_prefix_length(self):
+        words = ['apl', 'aple', 'apple', 'applex', 'orange', 'rnge', 'simone', 'simon', 'watermelon',
+                 'wassermelon', 'circumstances', 'circumstance', 'mountains', 'mountain']
+        full = self.other_dictionary()
+        full.add_words(words)
+        prefixed = self.other_dictionary(prefix_length=7)
+        prefixed.add_words(words)
+        for word in words + ['aplpe', 'orang', 'simo', 'xyz', 'watermelno', 'cricumstances', 'moubtains']:
+            # the best suggestion is the same, more suggestions may be found since less of them are pruned
+            self.assertListEqual(full.lookup(word)[:1], prefixed.lookup(word)[:1])
+            self.assertTrue(set(full.lookup(word)).issubset(prefixed.lookup(word)))
+        self.assertLess(len(keyspace(prefixed)[1]), len(keyspace(full)[1]))
+        chunked = self.other_dictionary(prefix_length=7)
+        chunked.add_words(words, chunk_size=4)
+        self.assertEqual(keyspace(prefixed), keyspace(chunked))
+        self.assertRaises(ValueError, lambda: Dictionary(edit_distance_max=2, prefix_length=2))
+
+    def test_bloom_filter(self):
+        words = ['apl', 'aple', 'apple', 'applex', 'orange', 'rnge', 'simone', 'simon', 'simon']
+        self.d.add_words(words[:5])
+        self.d.add_words(words[5:], chunk_size=2)
+        d = self.other_dictionary(bloom_filter=BloomFilter(1000))
+        d.add_words(words[:5])
+        d.add_words(words[5:], chunk_size=2)
+        queries = words + ['aplpe', 'orang', 'simo', 'xyz', 'rn']
+        for word in queries:
+            self.assertListEqual(sorted(self.d.lookup(word, True)), sorted(d.lookup(word, True)))
+        self.assertListEqual([sorted(r) for r in self.d.lookup_many(queries)],
+                             [sorted(r) for r in d.lookup_many(queries)])
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'dictionary.bin')
+            d.save(path)
+            opened = Dictionary.open(path)
+            self.assertEqual(d._bloom.count, opened._bloom.count)
+            self.assertListEqual(sorted(d.lookup('aplpe')), sorted(opened.lookup('aplpe')))
+            del opened
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_save_open(self):
+        words = ['apl', 'aple', 'apple', 'applex', 'orange', 'rnge', 'simone', 'simon', 'simon', u'caff\xe8']
+        self.d.add_words(words)
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'dictionary.bin')
+            self.d.save(path)
+            opened = Dictionary.open(path)
+            self.assertEqual(self.d.edit_distance_max, opened.edit_distance_max)
+            self.assertEqual(keyspace(self.d), keyspace(opened))
+            for word in words + ['aplpe', 'orang', 'simo', 'xyz', u'caffe']:
+                self.assertListEqual(self.d.lookup(word, True), opened.lookup(word, True))
+            self.assertRaises(TypeError, opened.add_word, 'kiwi')
+            del opened
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_weighted_ranking(self):
+        words = ['hello', 'hallo', 'hallo', 'night', 'nice', 'nice', 'phone', 'fine', 'fine']
+        self.d.add_words(words)
+        self.assertListEqual(['hallo', 'hello'], self.d.lookup('hrllo'))
+        d = self.other_dictionary(best_suggestions_only=False, edit_costs=KeyboardCosts(), phonetic=True)
+        d.add_words(words[:4])
+        d.add_words(words[4:], chunk_size=2)
+        self.assertListEqual([('hello', 0.5), ('hallo', 1)], d.lookup('hrllo', True))  # r is next to e, not to a
+        self.assertListEqual([('hello', 0.75), ('hallo', 2)], d.lookup('hlelo', True))
+        self.assertListEqual(['hello'], d.lookup('hrllo', top_k=1))
+        # 'night' is too far from 'nite', but it sounds the same
+        self.assertListEqual([('nice', 1), ('night', 1.25), ('fine', 2)], d.lookup('nite', True))
+        unit_costs = Dictionary(best_suggestions_only=False, phonetic=True, store=d._store)
+        self.assertListEqual([('nice', 1), ('night', 1.5), ('fine', 2)], unit_costs.lookup('nite', True))
+        # the phonetic matches and the counts of the results are fetched with two batches, not one read per result
+        collector = MetricsCollector()
+        observed = Dictionary(best_suggestions_only=False, edit_costs=KeyboardCosts(), phonetic=True, store=d._store,
+                              observer=collector)
+        self.assertListEqual(d.lookup('nite', True), observed.lookup('nite', True))
+        timings = collector.snapshot()[1]
+        self.assertEqual(2, timings['storage.fetch_many'].count)
+        self.assertNotIn('storage.__getitem__', timings)
+        self.assertNotIn('storage.smembers', timings)
+        queries = ['hrllo', 'nite', 'fone', 'xyz']
+        self.assertListEqual([d.lookup(word, True) for word in queries], d.lookup_many(queries, True))
+        d.remove_word('night')
+        self.assertListEqual([('nice', 1), ('fine', 2)], d.lookup('nite', True))
+        self.assertRaises(ValueError, lambda: KeyboardCosts(adjacent=2))
+
+    def test_export_restore(self):
+        self.d.add_words(self.words + ['apple', 'banana'])
+        for include_index in (False, True):
+            f = io.BytesIO()
+            self.d.export(f, include_index, batch_size=5)
+            f.seek(0)
+            restored = self.other_dictionary()
+            restored.restore(f, batch_size=5)
+            self.assertEqual(keyspace(self.d), keyspace(restored))
+            self.assertDictEqual(self.d.stats(), restored.stats())
+
+    def test_lookup_cache(self):
+        d = self.other_dictionary(cache_size=2)
+        d.add_word('simone')
+        self.assertListEqual(['simone'], d.lookup('simo'))
+        self.assertListEqual(['simone'], d.lookup('simo'))
+        self.assertListEqual([('simone', 2)], d.lookup('simo', return_distances=True))
+        self.assertEqual((1, 2, 2, 2), tuple(d.cache_info()))
+        d.add_word('simon')  # a closer word arrives and invalidates the cache
+        self.assertListEqual(['simon'], d.lookup('simo'))
+        d.add_words(['sim', 'sim'], chunk_size=2)
+        self.assertListEqual(['sim', 'simon'], sorted(d.lookup('simo')))
+        self.assertIsNone(self.d.cache_info())
+
+    def test_ingest(self):
+        text = u'Apple, apple... APPLE! Orange? kiwi\nkiwi-banana ' * 3
+        expected = self.other_dictionary()
+        expected.add_words([w.lower() for w in text.replace(',', ' ').replace('.', ' ').replace('!', ' ')
+                            .replace('?', ' ').replace('-', ' ').split()])
+        for max_distinct in (1, 2, 100):
+            d = self.other_dictionary()
+            d.ingest(text.splitlines(True), max_distinct=max_distinct)
+            self.assertEqual(keyspace(expected), keyspace(d))
+        self.assertEqual(9, d._terms['apple'])
+
+    def test_add_words_chunks(self):
+        words = self.words * 3 + ['ciao', 'ciaoB', 'miao', 'simone', 'simon', 'aple']
+        for best_suggestions_only in (True, False):
+            expected = self.other_dictionary(best_suggestions_only=best_suggestions_only)
+            expected.add_words(words)
+            for chunk_size in (1, 4, len(words)):
+                d = self.other_dictionary(best_suggestions_only=best_suggestions_only)
+                d.add_words(words[:5])  # chunks must be merged with what is already stored
+                d.add_words(words[5:], chunk_size=chunk_size)
+                self.assertEqual(keyspace(expected), keyspace(d))
+
+
 class DictionaryTestsRedis(DictionaryTests):
     def setUp(self):
         self.d = Dictionary(storage_type='redis', flush_db=True, host=redis_host, port=redis_port, db=redis_db)
         self.words = DictionaryTests.some_words()
 
+    def other_dictionary(self, **kwargs):
+        # alternate between two databases so that the dictionaries compared in a test are kept apart
+        self._other_db = redis_db + 1 if getattr(self, '_other_db', None) != redis_db + 1 else redis_db + 2
+        return Dictionary(storage_type='redis', flush_db=True, host=redis_host, port=redis_port,
+                          db=self._other_db, **kwargs)
+
+    def test_server_side_lookup(self):
+        words = ['apl', 'aple', 'apple', 'applex', 'orange', 'rnge', 'simone', 'simon', 'simon', u'caff\xe8']
+        self.d.add_words(words)
+        d = Dictionary(storage_type='redis', host=redis_host, port=redis_port, db=redis_db, server_side_lookup=True)
+        for word in words + ['aplpe', 'orang', 'simo', 'xyz', 'rn', u'caffe']:
+            self.assertListEqual(sorted(self.d.lookup(word, True)), sorted(d.lookup(word, True)))
+        self.assertRaises(ValueError, lambda: Dictionary(server_side_lookup=True))
+
     def tearDown(self):
         # flush the database via storage
-        storage('redis', flush_db=True, host=redis_host, port=redis_port, db=redis_db)
+        for db in (redis_db, redis_db + 1, redis_db + 2):
+            storage('redis', flush_db=True, host=redis_host, port=redis_port, db=db)
+
+
+class DictionaryTestsSharded(DictionaryTests):
+    def sharded(self, dbs, **kwargs):
+        shards = dict((str(db), {'host': redis_host, 'port': redis_port, 'db': db}) for db in dbs)
+        return Dictionary(storage_type='sharded', flush_db=True, shards=shards, **kwargs)
+
+    def setUp(self):
+        self.d = self.sharded(range(8, 11))
+        self.words = DictionaryTests.some_words()
+
+    def other_dictionary(self, **kwargs):
+        # alternate between two sets of databases so that the dictionaries compared in a test are kept apart
+        self._other_dbs = range(11, 13) if getattr(self, '_other_dbs', None) != range(11, 13) else range(13, 15)
+        return self.sharded(self._other_dbs, **kwargs)
+
+    def tearDown(self):
+        for db in range(8, 15):
+            storage('redis', flush_db=True, host=redis_host, port=redis_port, db=db)
+
+
+class DictionaryTestsCompact(DictionaryTests):
+    def setUp(self):
+        self.d = Dictionary(storage_type='compact')
+        self.words = DictionaryTests.some_words()
+
+    def other_dictionary(self, **kwargs):
+        return Dictionary(storage_type='compact', **kwargs)
+
+
+class DictionaryTestsSnapshot(DictionaryTests):
+    def setUp(self):
+        self.d = Dictionary(storage_type='snapshot')
+        self.words = DictionaryTests.some_words()
+
+    def other_dictionary(self, **kwargs):
+        return Dictionary(storage_type='snapshot', **kwargs)
+
+
+class ConcurrencyTests(unittest.TestCase):
+    """
+    Stress tests of a dictionary shared by several threads
+    """
+    def setUp(self):
+        rnd = random.Random(0)
+        self.words = [''.join(rnd.choice('abcdef') for _ in range(rnd.randint(3, 7))) for _ in range(1200)]
+        self.known = self.words[:200]
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)  # switch threads as often as possible
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+
+    def run_threads(self, d, writers, readers):
+        """
+        Runs the `writers` and, until they are done, the `readers`. Returns the errors raised by the threads.
+        """
+        errors, done = [], threading.Event()
+
+        def run(target, *args):
+            try:
+                target(*args)
+            except Exception as e:
+                errors.append(e)
+
+        def read(reader):
+            while not done.is_set():
+                reader()
+        writer_threads = [threading.Thread(target=run, args=(writer,)) for writer in writers]
+        reader_threads = [threading.Thread(target=run, args=(read, reader)) for reader in readers]
+        for thread in reader_threads + writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        done.set()
+        for thread in reader_threads:
+            thread.join()
+        return errors
+
+    def check_lookups(self, d):
+        rnd = random.Random()
+        for word in rnd.sample(self.known, 20):
+            results = d.lookup(word, True)
+            self.assertEqual((word, 0), results[0])  # known words are always found
+            self.assertTrue(all(distance <= d.edit_distance_max for _, distance in results))
+
+    def check_snapshot(self, d):
+        view = d._store.snapshot()
+        terms, suggestions = d._terms.bind(view), d._suggestions.bind(view)
+        for delete in suggestions.terms[:200]:
+            members = suggestions[delete]
+            self.assertTrue(members)  # sets are never seen half cleared
+            if d.best_suggestions_only:
+                self.assertEqual(1, len(set(len(member) for member in members)))
+            for member in members:
+                self.assertGreater(terms[member], 0)  # suggestions are published with their terms
+
+    def test_concurrent_updates(self):
+        for best_suggestions_only in (True, False):
+            d = Dictionary(storage_type='snapshot', best_suggestions_only=best_suggestions_only, cache_size=50)
+            d.add_words(self.known)
+            rest = self.words[len(self.known):]
+            writers = [lambda: d.add_words(rest[0::4]),
+                       lambda: d.add_words(rest[1::4]),
+                       lambda: d.add_words(rest[2::4], chunk_size=7),
+                       lambda: d.add_words(rest[3::4], chunk_size=50)]
+            readers = [lambda: self.check_lookups(d), lambda: self.check_lookups(d), lambda: self.check_snapshot(d)]
+            self.assertListEqual([], self.run_threads(d, writers, readers))
+            expected = Dictionary(best_suggestions_only=best_suggestions_only)
+            expected.add_words(self.words)
+            self.assertEqual(keyspace(expected), keyspace(d))
+            self.assertDictEqual(expected.stats(), d.stats())
+            for word in ['abcde', 'fedc', 'aaa', 'bcdfe']:
+                self.assertListEqual(sorted(expected.lookup(word, True)), sorted(d.lookup(word, True)))
+
+    def test_concurrent_removals(self):
+        d = Dictionary(storage_type='snapshot', keep_full_postings=True)
+        d.add_words(self.words)
+        removed = [word for word in set(self.words[len(self.known):]) if word not in self.known]
+        writers = [lambda: [d.remove_word(word) for word in removed[0::3]],
+                   lambda: [d.decrement(word, 100) for word in removed[1::3]],
+                   lambda: d.remove_words(removed[2::3]),
+                   lambda: d.add_words(self.known)]
+        readers = [lambda: self.check_lookups(d), lambda: self.check_snapshot(d)]
+        self.assertListEqual([], self.run_threads(d, writers, readers))
+        expected = Dictionary(keep_full_postings=True)
+        expected.add_words(self.known + [word for word in self.words if word not in removed])
+        self.assertEqual(keyspace(expected), keyspace(d))
+        self.assertDictEqual(expected.stats(), d.stats())
 
 
 if __name__ == '__main__':
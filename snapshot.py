@@ -0,0 +1,129 @@
+"""
+Portable snapshots of dictionaries, to move them between storages and environments without rebuilding them.
+
+A snapshot is a gzip compressed text file of JSON lines. The first line is a header with the format, its version,
+the parameters of the dictionary and whether the index of deletes is included. It is followed by a line for each
+term, `["t", term, count]`, possibly by a line for each delete, `["s", delete, [suggestion, ...]]`, and by a trailer,
+`["end", terms, deletes]`, so that truncated snapshots are detected.
+"""
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import gzip
+import json
+from itertools import islice
+
+FORMAT = 'pyspell-snapshot'
+VERSION = 1
+INDEX_PARAMETERS = ('edit_distance_max', 'best_suggestions_only', 'prefix_length', 'keep_full_postings')
+
+
+def _batches(iterable, size):
+    iterable = iter(iterable)
+    while True:
+        batch = list(islice(iterable, size))
+        if not batch:
+            break
+        yield batch
+
+
+def _distinct(keys, seen):
+    for key in keys:
+        if key not in seen:
+            seen.add(key)
+            yield key
+
+
+def _line(*record):
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def export(dictionary, path, include_index=False, batch_size=1000):
+    """
+    Writes a snapshot of `dictionary` to `path`, a file name or a binary file object, and returns a tuple with the
+    number of terms and deletes written. Keys are listed with `scan_iter`, which doesn't block Redis, and fetched
+    `batch_size` at a time, so only the keys, and not their values, are kept in memory: keys listed more than once,
+    as `scan_iter` may do, are written once. The index of deletes is only written if `include_index` is True: it
+    makes restores faster and snapshots larger.
+    """
+    store = dictionary._store
+    header = {'format': FORMAT, 'version': VERSION, 'index': include_index,
+              'params': dict((name, getattr(dictionary, name)) for name in INDEX_PARAMETERS)}
+    written = [0, 0]
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        f.write(json.dumps(header) + '\n')
+        kinds = [('t', dictionary._terms)] + ([('s', dictionary._suggestions)] if include_index else [])
+        for i, (kind, terms) in enumerate(kinds):
+            prefix, seen = terms.key(''), set()
+            for keys in _batches(_distinct(store.scan_iter(prefix), seen), batch_size):
+                fetched = store.fetch_many(keys, [])[0] if kind == 't' else store.fetch_many([], keys)[1]
+                for key, value in zip(keys, fetched):
+                    if value:
+                        f.write(_line(kind, key[len(prefix):], int(value) if kind == 't'
+                                      else sorted(str(member) for member in value)))
+                        written[i] += 1
+        f.write(_line('end', *written))
+    return tuple(written)
+
+
+def restore(dictionary, path, batch_size=1000):
+    """
+    Adds the terms of the snapshot at `path`, a file name or a binary file object, to `dictionary` and returns a
+    tuple with the number of terms and deletes read. Records are written in batches of `batch_size`, with the
+    pipelined writes of the storage, so memory doesn't grow with the size of the snapshot.
+
+    If the snapshot includes the index of deletes, it is restored as it is, and the index parameters of the
+    dictionary must be the same as the ones of the snapshot. Otherwise the index is recomputed from the terms,
+    with the parameters of the dictionary. Phonetic keys, if indexed, are always recomputed.
+    A `ValueError` is raised for files that aren't snapshots or have an invalid header, for unsupported versions,
+    and for truncated snapshots, after the records read have been restored.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            header = json.loads(f.readline() or 'null')
+        except (OSError, ValueError):
+            header = None
+        if not isinstance(header, dict) or header.get('format') != FORMAT:
+            raise ValueError('%s is not a pyspell snapshot.' % path)
+        version, with_index, params = header.get('version'), header.get('index'), header.get('params')
+        if not isinstance(version, int) or not isinstance(with_index, bool):
+            raise ValueError('%s has an invalid header.' % path)
+        if version > VERSION:
+            raise ValueError('Snapshot version %s is not supported.' % version)
+        if with_index:
+            if not isinstance(params, dict):
+                raise ValueError('%s has an invalid header.' % path)
+            different = [name for name in INDEX_PARAMETERS if params.get(name) != getattr(dictionary, name)]
+            if different:
+                raise ValueError('The index of the snapshot has different %s.' % ', '.join(different))
+
+        read, trailer = [0, 0], None
+        counts, suggestions = dict(), dict()
+        try:
+            for line in f:
+                record = json.loads(line)
+                if record[0] == 't':
+                    counts[record[1]] = record[2]
+                    read[0] += 1
+                elif record[0] == 's':
+                    suggestions[record[1]] = set(record[2])
+                    read[1] += 1
+                elif record[0] == 'end':
+                    trailer = record[1:]
+                    break
+                if len(counts) + len(suggestions) >= batch_size:
+                    _store(dictionary, counts, suggestions, with_index)
+                    counts, suggestions = dict(), dict()
+        except (EOFError, OSError, json.JSONDecodeError):  # the compressed stream or the last line is cut
+            trailer = None
+        _store(dictionary, counts, suggestions, with_index)
+    if trailer != read:
+        raise ValueError('%s is truncated.' % path)
+    return tuple(read)
+
+
+def _store(dictionary, counts, suggestions, with_index):
+    if with_index:
+        if counts or suggestions:
+            dictionary._store_index(counts, suggestions)
+    elif counts:
+        dictionary._store_counts(counts)
@@ -0,0 +1,100 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pyspell import Dictionary
+from pyspell_tests import keyspace
+from snapshot import export, restore, VERSION
+
+WORDS = ['apl', 'aple', 'apple', 'applex', 'orange', 'rnge', 'simone', 'simon', 'simon', u'caff\xe8', '123']
+
+
+class SnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self.d = Dictionary(keep_full_postings=True)
+        self.d.add_words(WORDS)
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'dictionary.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        for include_index in (False, True):
+            self.assertEqual((10, len(keyspace(self.d)[1]) if include_index else 0),
+                             export(self.d, self.path, include_index, batch_size=3))
+            restored = Dictionary(keep_full_postings=True)
+            restored.add_word('simon')  # counts are added to the ones already stored
+            self.assertEqual((10, len(keyspace(self.d)[1]) if include_index else 0),
+                             restore(restored, self.path, batch_size=4))
+            self.assertEqual(3, int(restored._terms['simon']))
+            restored.decrement('simon')
+            self.assertEqual(keyspace(self.d), keyspace(restored))
+            self.assertDictEqual(self.d.stats(), restored.stats())
+        for word in WORDS + ['aplpe', 'orang', 'simo', 'xyz', u'caffe']:
+            self.assertListEqual(self.d.lookup(word, True), restored.lookup(word, True))
+
+    def test_duplicate_keys(self):
+        # keys listed twice by scan_iter, as Redis SCAN may do, are exported once
+        scan_iter = self.d._store.scan_iter
+        self.d._store.scan_iter = lambda prefix='': (key for key in list(scan_iter(prefix)) * 2)
+        for include_index in (False, True):
+            self.assertEqual((10, len(keyspace(self.d)[1]) if include_index else 0),
+                             export(self.d, self.path, include_index))
+            restored = Dictionary(keep_full_postings=True)
+            restore(restored, self.path, batch_size=1)
+            self.assertEqual(keyspace(self.d), keyspace(restored))
+            self.assertDictEqual(self.d.stats(), restored.stats())
+
+    def test_file_objects(self):
+        f = io.BytesIO()
+        self.d.export(f, include_index=True)
+        f.seek(0)
+        restored = Dictionary(keep_full_postings=True)
+        restored.restore(f)
+        self.assertEqual(keyspace(self.d), keyspace(restored))
+
+    def test_recompute(self):
+        # without the index, a snapshot can be restored into a dictionary with other parameters
+        export(self.d, self.path)
+        restored, expected = Dictionary(edit_distance_max=1), Dictionary(edit_distance_max=1)
+        restore(restored, self.path)
+        expected.add_words(WORDS)
+        self.assertEqual(keyspace(expected), keyspace(restored))
+        export(self.d, self.path, include_index=True)
+        self.assertRaises(ValueError, lambda: restore(Dictionary(edit_distance_max=1), self.path))
+        self.assertRaises(ValueError, lambda: restore(Dictionary(), self.path))  # keep_full_postings differs
+
+    def test_invalid(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot')
+        self.assertRaises(ValueError, lambda: restore(Dictionary(), self.path))
+        with gzip.open(self.path, 'wt') as f:
+            f.write(json.dumps({'format': 'pyspell-snapshot', 'version': VERSION + 1, 'index': False}) + '\n')
+        self.assertRaises(ValueError, lambda: restore(Dictionary(), self.path))
+        for header in ({'format': 'pyspell-snapshot'}, {'format': 'pyspell-snapshot', 'version': VERSION},
+                       {'format': 'pyspell-snapshot', 'version': 'latest', 'index': False},
+                       {'format': 'pyspell-snapshot', 'version': VERSION, 'index': True}):
+            with gzip.open(self.path, 'wt') as f:
+                f.write(json.dumps(header) + '\n')
+            self.assertRaises(ValueError, lambda: restore(Dictionary(), self.path))
+
+        export(self.d, self.path, include_index=True)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with gzip.open(self.path, 'rt') as f:
+            lines = f.readlines()
+        for truncated in (data[:len(data) // 2], gzip.compress(''.join(lines[:-1]).encode('utf-8')),
+                          gzip.compress(''.join(lines)[:-20].encode('utf-8'))):
+            with open(self.path, 'wb') as f:
+                f.write(truncated)
+            self.assertRaises(ValueError, lambda: restore(Dictionary(keep_full_postings=True), self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
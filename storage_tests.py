@@ -1,7 +1,9 @@
 __author__ = 'simone'
 
+import threading
+import time
 import unittest
-from storage import RedisStorage, DictStorage
+from storage import RedisStorage, ShardedRedisStorage, DictStorage, CompactStorage, Snapshot, SnapshotStorage
 
 
 class StorageTests(unittest.TestCase):
@@ -32,6 +34,122 @@ class StorageTests(unittest.TestCase):
         self.storage.sclear('fruit')
         self.assertSetEqual(set(), self.storage.smembers('fruit'))
 
+    def test_many(self):
+        self.storage['hello'] = 1
+        self.assertEqual([3], self.storage.incrby_many({'hello': 2}))
+        self.assertEqual([2], self.storage.incrby_many({'hi': 2}))
+        self.storage.sadd('fruit', 'kiwi')
+        self.storage.sadd_many({'fruit': ['apple'], 'veg': ['leek', 'kale']})
+        self.assertSetEqual(set(['kiwi', 'apple']), self.storage.smembers('fruit'))
+        self.assertSetEqual(set(['leek', 'kale']), self.storage.smembers('veg'))
+        self.storage.sadd_many({'fruit': ['fig'], 'veg': ['cabbage']}, shortest_only=True)
+        self.assertSetEqual(set(['fig']), self.storage.smembers('fruit'))  # replaced, since shorter
+        self.assertSetEqual(set(['leek', 'kale']), self.storage.smembers('veg'))  # untouched, since longer
+        self.storage.sadd_many({'veg': ['bean'], 'nut': ['pecan']}, shortest_only=True)
+        self.assertSetEqual(set(['leek', 'kale', 'bean']), self.storage.smembers('veg'))
+        self.assertSetEqual(set(['pecan']), self.storage.smembers('nut'))
+
+        values, sets = self.storage.fetch_many(['hello', 'missing'], ['nut', 'missing'])
+        self.assertEqual([3, None], values)
+        self.assertListEqual([set(['pecan']), set()], sets)
+
+    def test_remove(self):
+        self.storage['hello'] = 1
+        self.storage.sadd('fruit', 'kiwi')
+        self.storage.sadd('fruit', 'apple')
+        self.storage.sadd('veg', 'leek')
+        self.storage.srem('fruit', 'kiwi')
+        self.storage.srem('fruit', 'fig')
+        self.assertSetEqual(set(['apple']), self.storage.smembers('fruit'))
+        self.storage.srem_many({'fruit': ['apple'], 'veg': ['kale']})
+        self.assertSetEqual(set(), self.storage.smembers('fruit'))
+        self.assertNotIn('fruit', set(self.storage.keys()))  # empty sets are removed
+        del self.storage['hello']
+        self.assertNotIn('hello', self.storage)
+        self.assertIsNone(self.storage['hello'])
+        self.storage.delete_many(['veg', 'missing'])
+        self.assertSetEqual(set(), self.storage.smembers('veg'))
+        self.assertListEqual([], list(self.storage.keys()))
+
+    def test_scan_iter(self):
+        for key in ('t:a', 't:b', 't*', 'x/t:a', 's:a'):
+            self.storage[key] = 1
+        self.storage.sadd('t:c', 'c')
+        self.assertSetEqual(set(['t:a', 't:b', 't:c']), set(self.storage.scan_iter('t:')))
+        self.assertSetEqual(set(['t*']), set(self.storage.scan_iter('t*')))
+        self.assertSetEqual(set(['t:a', 't:b', 't:c', 't*', 'x/t:a', 's:a']), set(self.storage.scan_iter()))
+
+
+class CompactStorageTests(StorageTests):
+    def setUp(self):
+        self.storage = CompactStorage()
+
+    def test_many_keys(self):
+        # enough keys to resize the hash table a few times
+        for i in range(1000):
+            self.storage.sadd('key%d' % i, 'value%d' % (i % 10))
+            self.storage.sadd('key%d' % i, 'value%d' % (i % 7))
+            self.storage['count%d' % i] = i
+        for i in range(1000):
+            self.assertSetEqual(set(['value%d' % (i % 10), 'value%d' % (i % 7)]), self.storage.smembers('key%d' % i))
+            self.assertEqual(i, self.storage['count%d' % i])
+        self.assertEqual(2000, len(self.storage.keys()))
+        self.assertIn('key999', self.storage.keys())
+        self.assertNotIn('key1000', self.storage)
+
+
+class SnapshotStorageTests(StorageTests):
+    def setUp(self):
+        self.storage = SnapshotStorage(shards=4)
+
+    def test_transaction(self):
+        self.storage['hello'] = 1
+        self.storage.sadd('fruit', 'kiwi')
+        before = self.storage.snapshot()
+        with self.storage.transaction():
+            self.storage.incrby('hello', 1)
+            self.storage.sadd('fruit', 'apple')
+            self.assertEqual(2, self.storage['hello'])  # the writer reads its own writes
+            seen = []
+            reader = threading.Thread(target=lambda: seen.append((self.storage['hello'],
+                                                                  self.storage.smembers('fruit'))))
+            reader.start()
+            reader.join()
+            self.assertListEqual([(1, set(['kiwi']))], seen)  # other threads don't
+        self.assertEqual(2, self.storage['hello'])
+        self.assertSetEqual(set(['kiwi', 'apple']), self.storage.smembers('fruit'))
+        self.assertEqual(1, before['hello'])  # snapshots never change
+        self.assertSetEqual(set(['kiwi']), before.smembers('fruit'))
+        self.assertRaises(TypeError, lambda: before.sadd('fruit', 'fig'))
+
+        def failing():
+            with self.storage.transaction():
+                self.storage['hello'] = 10
+                self.storage.srem('fruit', 'kiwi')
+                raise KeyError('hello')
+        self.assertRaises(KeyError, failing)
+        self.assertEqual(2, self.storage['hello'])  # nothing published
+        self.assertSetEqual(set(['kiwi', 'apple']), self.storage.smembers('fruit'))
+
+    def test_copy_on_write(self):
+        # writes copy the leaves of the keys they touch, not a share of all the keys
+        storage = SnapshotStorage(shards=4, leaf_size=8)
+        storage.incrby_many(dict(('count%d' % i, i) for i in range(5000)))
+        storage.sadd_many(dict(('set%d' % i, ['x']) for i in range(5000)))
+        before = storage.snapshot()
+        with storage.transaction():
+            storage.incrby('count0', 1)
+            storage.sadd('set0', 'y')
+        leaves = [set(id(leaf) for leaf in Snapshot._leaves(view._root)) for view in (before, storage.snapshot())]
+        self.assertLessEqual(len(leaves[1].difference(leaves[0])), 2)
+        self.assertLessEqual(max(len(leaf) for leaf in Snapshot._leaves(storage._root)), 8)
+        self.assertEqual(10000, len(storage.keys()))
+        self.assertListEqual([1] + list(range(1, 5000)), [storage['count%d' % i] for i in range(5000)])
+        self.assertSetEqual(set(['x', 'y']), storage.smembers('set0'))
+        self.assertEqual(0, before['count0'])
+        self.assertSetEqual(set(['x']), before.smembers('set0'))
+
+
 class RedisStorageTests(StorageTests):
     def setUp(self):
         self.storage = RedisStorage(flush_db=True, host='localhost', port=6379, db=5)
@@ -39,5 +157,114 @@ class RedisStorageTests(StorageTests):
     def tearDown(self):
         self.storage._r.flushdb()
 
+class ShardedRedisStorageTests(StorageTests):
+    shards = dict((name, {'host': 'localhost', 'port': 6379, 'db': db}) for name, db in (('a', 8), ('b', 9), ('c', 10)))
+
+    def setUp(self):
+        self.storage = ShardedRedisStorage(self.shards, flush_db=True)
+
+    def tearDown(self):
+        for db in (8, 9, 10, 11):
+            RedisStorage(flush_db=True, host='localhost', port=6379, db=db)
+
+    def test_shards(self):
+        keys = ['t:%d' % i for i in range(300)]
+        self.storage.incrby_many(dict((key, i) for i, key in enumerate(keys)))
+        self.storage.sadd_many(dict(('s:%d' % i, ['x', 'y']) for i in range(300)))
+        for name, shard in self.storage._shards.items():
+            shard_keys = list(shard.keys())
+            self.assertGreater(len(shard_keys), 100)  # keys are spread over all the shards
+            for key in shard_keys:
+                self.assertEqual(name, self.storage.shard(key))
+
+        self.storage.add_shard('d', {'host': 'localhost', 'port': 6379, 'db': 11}, batch_size=7)
+        self.assertGreater(len(list(self.storage._shards['d'].keys())), 50)
+        for name, shard in self.storage._shards.items():
+            for key in shard.keys():
+                self.assertEqual(name, self.storage.shard(key))
+        values, sets = self.storage.fetch_many(keys, ['s:%d' % i for i in range(300)])
+        self.assertListEqual(list(range(300)), values)
+        self.assertListEqual([set(['x', 'y'])] * 300, sets)
+        self.assertEqual(600, len(list(self.storage.scan_iter())))
+        self.assertRaises(ValueError, lambda: self.storage.add_shard('d', {'db': 11}))
+
+    def test_migration(self):
+        # keys written while migrating go to the new shard, and are merged with the ones being moved
+        self.storage.incrby_many(dict(('t:%d' % i, 1) for i in range(100)))
+        self.storage.sadd_many(dict(('s:%d' % i, ['x']) for i in range(100)))
+        self.storage._previous = self.storage._ring
+        self.storage._shards['d'] = RedisStorage(host='localhost', port=6379, db=11)
+        self.storage._ring = self.storage._build_ring(self.storage._shards)
+        self.storage.incrby_many(dict(('t:%d' % i, 1) for i in range(100)))
+        self.storage.sadd_many(dict(('s:%d' % i, ['y']) for i in range(100)))
+        self.storage.delete_many(['t:0', 's:0'])
+        expected = [None] + [2] * 99, [set()] + [set(['x', 'y'])] * 99
+        self.assertEqual(expected, self.storage.fetch_many(['t:%d' % i for i in range(100)],
+                                                           ['s:%d' % i for i in range(100)]))
+        self.storage._migrate_to('d', self.storage._shards['d'], 10)
+        self.storage._previous = None
+        self.assertEqual(expected, self.storage.fetch_many(['t:%d' % i for i in range(100)],
+                                                           ['s:%d' % i for i in range(100)]))
+
+    def test_writes_while_adding(self):
+        # keys written during add_shard are moved first, so that the writes see their whole values and removals
+        # aren't undone by the moves
+        storage = self.storage
+        sets, counts = ['s:%d' % i for i in range(200)], ['t:%d' % i for i in range(200)]
+        removed = ['r:%d' % i for i in range(200)]
+        storage.sadd_many(dict((key, ['abc']) for key in sets), shortest_only=True)
+        storage.sadd_many(dict((key, ['x', 'y']) for key in removed))
+        storage.incrby_many(dict((key, 1) for key in counts))
+        migrate_to, migrate, written, removers = storage._migrate_to, storage._migrate, [], []
+
+        def write_and_migrate(name, target, batch_size):
+            written.append(storage.incrby_many(dict((key, 1) for key in counts)))
+            storage.sadd_many(dict((key, ['ab']) for key in sets), shortest_only=True)
+            storage.sadd_many(dict((key, ['abcd']) for key in sets), shortest_only=True)
+            storage.srem_many(dict((key, ['x']) for key in removed[:100]))
+            storage.delete_many(counts[:10])
+            del storage[counts[10]]
+            migrate_to(name, target, batch_size)
+
+        def move_and_remove(source, target, keys):
+            if not removers:  # removals issued while a batch is being moved wait for it
+                removers.append(threading.Thread(target=lambda: storage.srem_many(dict((key, ['x'])
+                                                                                       for key in removed[100:]))))
+                removers[0].start()
+                time.sleep(0.05)
+                self.assertTrue(removers[0].is_alive())
+            migrate(source, target, keys)
+        storage._migrate_to, storage._migrate = write_and_migrate, move_and_remove
+        storage.add_shard('d', {'host': 'localhost', 'port': 6379, 'db': 11}, batch_size=7)
+        removers[0].join()
+        self.assertIsNone(storage._previous)
+        self.assertListEqual([[2] * 200], written)
+        self.assertEqual(([None] * 11 + [2] * 189, [set(['ab'])] * 200), storage.fetch_many(counts, sets))
+        self.assertListEqual([set(['y'])] * 200, storage.fetch_many([], removed)[1])
+        self.assertGreater(len(list(storage._shards['d'].keys())), 50)
+        for name, shard in storage._shards.items():
+            for key in shard.keys():
+                self.assertEqual(name, storage.shard(key))
+
+    def test_write_before_adding(self):
+        # writes placed with the ring before add_shard are done before the ring changes, and then moved
+        storage = self.storage
+        keys = ['t:%d' % i for i in range(200)]
+        adding = threading.Thread(target=lambda: storage.add_shard('d', {'host': 'localhost', 'port': 6379,
+                                                                         'db': 11}, batch_size=7))
+        with storage._writing(keys) as ring:
+            adding.start()
+            while not storage._moving._waiting:  # add_shard waits for the writes
+                time.sleep(0.001)
+            for key in keys:
+                storage._shards[storage._owner(ring, key)].incrby(key, 1)
+        adding.join()
+        self.assertListEqual([1] * 200, storage.fetch_many(keys, [])[0])
+        self.assertGreater(len(list(storage._shards['d'].keys())), 20)
+        for name, shard in storage._shards.items():
+            for key in shard.keys():
+                self.assertEqual(name, storage.shard(key))
+
+
 if __name__ == '__main__':
     unittest.main()
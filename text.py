@@ -0,0 +1,71 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import codecs
+import re
+
+
+def read_chunks(source, chunk_size=1 << 16):
+    """
+    Generates the text of `source` in chunks of at most `chunk_size` characters. `source` can be the path
+    of a UTF-8 encoded text file, a file-like object or an iterable of strings (e.g., a list of lines).
+    The strings of an iterable are generated as separate lines: a newline is appended to those not ending
+    with one.
+    """
+    if isinstance(source, str):
+        with codecs.open(source, encoding='utf-8') as f:
+            for chunk in read_chunks(f, chunk_size):
+                yield chunk
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        for chunk in source:
+            yield chunk if chunk.endswith('\n') else chunk + '\n'
+
+
+class Tokenizer(object):
+    """
+    Splits text into tokens. Tokens are the matches of the regular expression `pattern` (by default,
+    sequences of letters and digits) and are possibly lowercased.
+    """
+    def __init__(self, pattern=r'[^\W_]+', lowercase=True):
+        self.pattern = re.compile(pattern, re.UNICODE)
+        self.lowercase = lowercase
+
+    def normalize(self, token):
+        return token.lower() if self.lowercase else token
+
+    def spans(self, text):
+        """
+        Generates tuples (start, end, token) for each token in `text`, where `text[start:end]` is the original
+        text of the (normalized) token.
+        """
+        for match in self.pattern.finditer(text):
+            yield match.start(), match.end(), self.normalize(match.group())
+
+    def tokens(self, text):
+        """
+        Generates the tokens in `text`.
+        """
+        for match in self.pattern.finditer(text):
+            yield self.normalize(match.group())
+
+    def iter_tokens(self, chunks):
+        """
+        Generates the tokens in a stream of text `chunks`. A token that spans two consecutive chunks
+        is generated once, as a whole.
+        """
+        tail = ''
+        for chunk in chunks:
+            text = tail + chunk
+            tail = ''
+            for match in self.pattern.finditer(text):
+                if match.end() == len(text):  # the token may continue in the next chunk
+                    tail = text[match.start():]
+                    break
+                yield self.normalize(match.group())
+        for token in self.tokens(tail):
+            yield token
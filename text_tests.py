@@ -0,0 +1,30 @@
+__author__ = 'Simone Mainardi, simonemainardi@startmail.com'
+
+import io
+import unittest
+from text import Tokenizer, read_chunks
+
+
+class TokenizerTests(unittest.TestCase):
+    def setUp(self):
+        self.tokenizer = Tokenizer()
+        self.text = u'Call me Ishmael. Some years ago_never mind how long precisely--having 1 or 2 coins'
+
+    def test_tokens(self):
+        self.assertListEqual(['call', 'me', 'ishmael', 'some', 'years', 'ago', 'never', 'mind'],
+                             list(self.tokenizer.tokens(self.text))[:8])
+        tokenizer = Tokenizer(r'[a-zA-Z]+', lowercase=False)
+        self.assertListEqual(['Call', 'me', 'Ishmael'], list(tokenizer.tokens(self.text))[:3])
+        self.assertListEqual([(0, 4, 'call'), (5, 7, 'me')], list(self.tokenizer.spans(self.text))[:2])
+
+    def test_iter_tokens(self):
+        expected = list(self.tokenizer.tokens(self.text))
+        for chunk_size in (1, 2, 3, 7, 100):
+            chunks = read_chunks(io.StringIO(self.text), chunk_size)
+            self.assertListEqual(expected, list(self.tokenizer.iter_tokens(chunks)))
+        chunks = read_chunks(['some', 'words\n', 'here'])
+        self.assertListEqual(['some', 'words', 'here'], list(self.tokenizer.iter_tokens(chunks)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,25 +1,98 @@
 __author__ = 'Simone Mainardi, simonemainardi@startmail.com'
 
+from itertools import combinations
+from operator import itemgetter
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, distances are computed in pure python without it
+    numpy = None
+
 
 class Word(object):
+    NUMPY_MIN_BATCH = 16  # the minimum number of words whose distances are computed with numpy
+    _kept_positions = dict()  # (word length, edit distance) -> itemgetters of the characters kept by each delete
+    _PHONETIC_INITIALS = (('kn', 'n'), ('gn', 'n'), ('pn', 'n'), ('wr', 'r'), ('ps', 's'), ('wh', 'w'), ('x', 's'))
+    _PHONETIC_GROUPS = (('sch', 'sk'), ('tch', 'ch'), ('ch', 'x'), ('sh', 'x'), ('ph', 'f'), ('th', '0'), ('ck', 'k'),
+                        ('dg', 'j'), ('gh', ''), ('qu', 'kw'))
+    _PHONETIC_SOUNDS = {'q': 'k', 'x': 'ks', 'z': 's', 'v': 'f', 'd': 't'}
+
     @staticmethod
     def deletes(word, edit_distance):
-        """ Recursively create all the possible deletes at a distance * less than or equal to * `edit_distance`
+        """ Create all the possible deletes at a distance * less than or equal to * `edit_distance`
         from the `word` provided. For example, all the possible delete edits of the word `ciao`, at an
         edit distance less than or equal to two are:
         -> cia, cao, cio, iao (distance 1)
-        -> ci, ia, ca, ca, ao, co, ci, io, co, ia, ao, io (distance 2)
+        -> ci, ia, ca, ao, co, io (distance 2)
 
-        Duplicates are suppressed.
+        Deletes are never shorter than one character. Duplicates are suppressed.
         """
-        dels = set()
-        if len(word) <= 1 or edit_distance == 0:
-            return dels
-        for i in range(len(word)):
-            delete = word[:i] + word[i+1:]  # remove the i-th character from the word
-            dels.update([delete])
-            dels.update(Word.deletes(delete, edit_distance - 1))
-        return dels
+        return set(Word.iter_deletes(word, edit_distance))
+
+    @staticmethod
+    def iter_deletes(word, edit_distance, cached=False):
+        """ Generates the same deletes returned by `deletes`, each one exactly once.
+
+        Deletes are generated level by level, without recursion. Characters are only deleted at or after
+        the position of the previous deletion, so every combination of positions is visited once, and the
+        second character of a pair of equal adjacent characters is never deleted, since deleting the first
+        one yields the same string. The few remaining duplicates (e.g., `a` from both `ab` and `ba` in `aba`)
+        are suppressed before being generated.
+
+        If `cached` is True, deletes are obtained from the combinations of positions of the characters to keep,
+        which are computed once for each word length and edit distance. This is faster when the same lengths
+        are seen over and over, at the cost of the memory taken by the cache.
+        """
+        if cached:
+            return Word._cached_deletes(word, edit_distance)
+        return Word._generated_deletes(word, edit_distance)
+
+    @staticmethod
+    def prefix_deletes(word, edit_distance, prefix_length=None):
+        """ Generates the deletes of the first `prefix_length` characters of `word`, preceded by the prefix
+        itself when `word` is longer than `prefix_length`. If `prefix_length` is None, this is the same as
+        `iter_deletes`.
+        """
+        if prefix_length is not None and len(word) > prefix_length:
+            word = word[:prefix_length]
+            yield word
+        for delete in Word.iter_deletes(word, edit_distance):
+            yield delete
+
+    @staticmethod
+    def _generated_deletes(word, edit_distance):
+        seen = set()
+        level = [(word, 0)]  # tuples (string, position of the last deletion)
+        for _ in range(edit_distance):
+            next_level = []
+            for current, start in level:
+                if len(current) <= 1:
+                    continue
+                for i in range(start, len(current)):
+                    if i > start and current[i] == current[i - 1]:
+                        continue  # same as deleting the previous character
+                    delete = current[:i] + current[i + 1:]  # remove the i-th character from the string
+                    if delete not in seen:
+                        seen.add(delete)
+                        yield delete
+                    next_level.append((delete, i))
+            level = next_level
+
+    @staticmethod
+    def _cached_deletes(word, edit_distance):
+        key = (len(word), edit_distance)
+        getters = Word._kept_positions.get(key)
+        if getters is None:
+            getters = [itemgetter(*kept)
+                       for distance in range(1, min(edit_distance, len(word) - 1) + 1)
+                       for kept in combinations(range(len(word)), len(word) - distance)]
+            Word._kept_positions[key] = getters
+        seen = set()
+        for getter in getters:
+            delete = ''.join(getter(word))
+            if delete not in seen:
+                seen.add(delete)
+                yield delete
 
     @staticmethod
     def shorter_words_within_distance(word, bag, distance):
@@ -33,31 +106,152 @@ class Word(object):
         return res
 
     @staticmethod
-    def damerau_levenshtein_distance(word1, word2):
+    def damerau_levenshtein_distance(word1, word2, max_distance=None):
         """
-        A genetic algorithm to compute the Damerau-Levenshtein distance between two words
+        Computes the Damerau-Levenshtein distance (optimal string alignment) between two words.
+
+        If `max_distance` is specified, only the cells of the matrix within `max_distance` from its diagonal
+        are computed, and the computation stops as soon as the distance is known to exceed `max_distance`.
+        In that case `max_distance + 1` is returned. Only three rows of the matrix are kept, in buffers
+        allocated once per call.
         """
-        d = {}
         lenstr1 = len(word1)
         lenstr2 = len(word2)
-        for i in xrange(-1, lenstr1 + 1):
-            d[(i, -1)] = i + 1
-        for j in xrange(-1, lenstr2 + 1):
-            d[(-1, j)] = j + 1
-
-        for i in xrange(lenstr1):
-            for j in xrange(lenstr2):
-                if word1[i] == word2[j]:
-                    cost = 0
-                else:
-                    cost = 1
-                d[(i, j)] = min(
-                    d[(i - 1, j)] + 1,  # deletion
-                    d[(i, j - 1)] + 1,  # insertion
-                    d[(i - 1, j - 1)] + cost,  # substitution
-                )
-                if i and j and word1[i] == word2[j - 1] and word1[i - 1] == word2[j]:
-                    d[(i, j)] = min(d[(i, j)], d[i - 2, j - 2] + cost)  # transposition
-
-        return d[lenstr1 - 1, lenstr2 - 1]
+        if max_distance is None:
+            max_distance = max(lenstr1, lenstr2)
+        over = max_distance + 1
+        if abs(lenstr1 - lenstr2) > max_distance:
+            return over
+        if not lenstr1 or not lenstr2:
+            return lenstr1 or lenstr2
+
+        # three rows of the matrix, rotated at each iteration: cells out of the band hold `over`
+        two_rows_back = [over] * (lenstr2 + 2)
+        previous_row = [min(j, over) for j in range(lenstr2 + 1)] + [over]
+        row = [over] * (lenstr2 + 2)
+        for i in range(1, lenstr1 + 1):
+            first = max(1, i - max_distance)
+            last = min(lenstr2, i + max_distance)
+            row[first - 1] = i if first == 1 else over
+            row_min = row[first - 1]
+            char1 = word1[i - 1]
+            for j in range(first, last + 1):
+                cost = 0 if char1 == word2[j - 1] else 1
+                d = min(previous_row[j] + 1,  # deletion
+                        row[j - 1] + 1,  # insertion
+                        previous_row[j - 1] + cost)  # substitution
+                if i > 1 and j > 1 and char1 == word2[j - 2] and word1[i - 2] == word2[j - 1]:
+                    d = min(d, two_rows_back[j - 2] + cost)  # transposition
+                row[j] = d if d < over else over
+                if d < row_min:
+                    row_min = d
+            row[last + 1] = over
+            if row_min > max_distance:
+                return over
+            two_rows_back, previous_row, row = previous_row, row, two_rows_back
+
+        return previous_row[lenstr2]
+
+    @staticmethod
+    def weighted_distance(word1, word2, costs, max_distance=None):
+        """
+        Computes the Damerau-Levenshtein distance (optimal string alignment) between two words, where each edit
+        costs what `costs` (a `costs.EditCosts`) returns for it. Edits transform `word1` into `word2`.
+
+        If `max_distance` is specified, the computation stops as soon as the distance is known to exceed
+        `max_distance`, and `max_distance + 1` is returned.
+        """
+        over = max_distance + 1 if max_distance is not None else None
+        previous_row = [0]
+        for char in word2:
+            previous_row.append(previous_row[-1] + costs.insertion(char))
+        two_rows_back = None
+        for i, char1 in enumerate(word1, 1):
+            row = [previous_row[0] + costs.deletion(char1)]
+            for j, char2 in enumerate(word2, 1):
+                d = min(previous_row[j] + costs.deletion(char1),
+                        row[j - 1] + costs.insertion(char2),
+                        previous_row[j - 1] + (costs.substitution(char1, char2) if char1 != char2 else 0))
+                if i > 1 and j > 1 and char1 != char2 and char1 == word2[j - 2] and word1[i - 2] == char2:
+                    d = min(d, two_rows_back[j - 2] + costs.transposition(word1[i - 2], char1))
+                row.append(d)
+            if over is not None and min(row) > max_distance:
+                return over
+            two_rows_back, previous_row = previous_row, row
+        return over if over is not None and previous_row[-1] > max_distance else previous_row[-1]
+
+    @staticmethod
+    def phonetic_key(word):
+        """
+        Returns a key of how `word` sounds in English, in the spirit of Metaphone: words that sound alike (e.g.,
+        `phone` and `fone`, or `night` and `nite`) are likely to have the same key. Groups of letters are first
+        replaced by the letter of their sound, vowels are only kept at the beginning, as an `a`, and repeated
+        sounds are collapsed. Characters other than letters are ignored, so the key can be empty.
+        """
+        word = ''.join(char for char in word.lower() if 'a' <= char <= 'z')
+        for initial, sound in Word._PHONETIC_INITIALS:
+            if word.startswith(initial):
+                word = sound + word[len(initial):]
+                break
+        for group, sound in Word._PHONETIC_GROUPS:
+            word = word.replace(group, sound)
+        key = []
+        for i, char in enumerate(word):
+            following = word[i + 1:i + 2]
+            if char in 'aeiou':
+                sound = 'a' if i == 0 else ''
+            elif char in 'cg':
+                sound = ('s' if char == 'c' else 'j') if following and following in 'eiy' else 'k'
+            elif char in 'hwy':
+                sound = char if following and following in 'aeiou' and (char != 'h' or i == 0) else ''
+            else:
+                sound = Word._PHONETIC_SOUNDS.get(char, char)
+            for sound_char in sound:
+                if not key or key[-1] != sound_char:
+                    key.append(sound_char)
+        return ''.join(key)
+
+    @staticmethod
+    def damerau_levenshtein_distances(word, others, max_distance):
+        """
+        Computes the bounded Damerau-Levenshtein distance (see `damerau_levenshtein_distance`) between `word` and
+        each word in `others`, and returns the list of the distances.
+
+        If numpy is installed and there are at least `NUMPY_MIN_BATCH` words, distances are computed all at once:
+        `others` are encoded as a matrix of code points, padded to the same length, and the rows of the distance
+        matrices are computed for all the words with vectorized operations.
+        """
+        others = list(others)
+        if numpy is None or len(others) < Word.NUMPY_MIN_BATCH:
+            return [Word.damerau_levenshtein_distance(word, other, max_distance) for other in others]
+        return Word._numpy_distances(word, others, max_distance).tolist()
+
+    @staticmethod
+    def _numpy_distances(word, others, max_distance):
+        over = max_distance + 1
+        lengths = numpy.array([len(other) for other in others])
+        width = int(lengths.max()) if len(others) else 0
+        codes = numpy.full((len(others), width), -1, dtype=numpy.int64)  # -1 pads the shorter words
+        for k, other in enumerate(others):
+            codes[k, :len(other)] = [ord(char) for char in other]
+        word_codes = [ord(char) for char in word]
+        columns = numpy.arange(width + 1)
 
+        two_rows_back = None
+        previous_row = numpy.tile(numpy.minimum(columns, over), (len(others), 1))
+        for i in range(1, len(word) + 1):
+            cost = (codes != word_codes[i - 1]).astype(numpy.int64)
+            row = numpy.empty_like(previous_row)
+            row[:, 0] = min(i, over)
+            row[:, 1:] = numpy.minimum(previous_row[:, 1:] + 1,  # deletion
+                                       previous_row[:, :-1] + cost)  # substitution
+            if i > 1 and width > 1:
+                transposed = (codes[:, :-1] == word_codes[i - 1]) & (codes[:, 1:] == word_codes[i - 2])
+                row[:, 2:] = numpy.where(transposed, numpy.minimum(row[:, 2:], two_rows_back[:, :-2] + cost[:, 1:]),
+                                         row[:, 2:])
+            # insertions: row[j] = min(row[j], row[j - 1] + 1), i.e., the running minimum of row[k] + (j - k)
+            row = numpy.minimum(numpy.minimum.accumulate(row - columns, axis=1) + columns, over)
+            if row.min() > max_distance:
+                return numpy.full(len(others), over)
+            two_rows_back, previous_row = previous_row, row
+        return previous_row[numpy.arange(len(others)), lengths]
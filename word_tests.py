@@ -2,6 +2,8 @@ __author__ = 'simone'
 
 import unittest
 
+import word as word_module
+from costs import EditCosts, KeyboardCosts
 from word import Word
 
 class WordDeletesTests(unittest.TestCase):
@@ -21,6 +23,15 @@ class WordDeletesTests(unittest.TestCase):
         self.assertSetEqual(Word.deletes('woho', 1),
                             set(['woh', 'oho', 'who', 'woo']))
 
+    def test_iter_deletes(self):
+        for word in ['ciao', 'aaa', 'bbb', 'woho', 'aba', 'mississippi', 'a', '']:
+            for edit_distance in range(4):
+                for cached in (False, True):
+                    deletes = list(Word.iter_deletes(word, edit_distance, cached=cached))
+                    self.assertEqual(len(deletes), len(set(deletes)))  # no duplicates
+                    self.assertSetEqual(set(deletes), Word.deletes(word, edit_distance))
+        self.assertSetEqual(Word.deletes('aba', 2), set(['ab', 'aa', 'ba', 'a', 'b']))
+
 
 class WordDamerauLevenstheinTests(unittest.TestCase):
     def test_damerau_levenshtein_distance(self):
@@ -33,6 +44,78 @@ class WordDamerauLevenstheinTests(unittest.TestCase):
         self.assertEqual(Word.damerau_levenshtein_distance('simone', 'siomne'), 1)
         self.assertEqual(Word.damerau_levenshtein_distance('simone', 'siomen'), 2)
 
+    def test_bounded_damerau_levenshtein_distance(self):
+        distance = Word.damerau_levenshtein_distance
+        self.assertEqual(distance('ciao', 'ciao', 0), 0)
+        self.assertEqual(distance('ciao', 'cia', 1), 1)
+        self.assertEqual(distance('ciao', 'cia', 0), 1)
+        self.assertEqual(distance('ciao', 'c', 2), 3)
+        self.assertEqual(distance('ciao', '', 2), 3)
+        self.assertEqual(distance('simone', 'siomne', 1), 1)
+        self.assertEqual(distance('simone', 'siomen', 1), 2)
+        self.assertEqual(distance('simone', 'siomen', 2), 2)
+        self.assertEqual(distance('abcdef', 'badcfe', 2), 3)
+        self.assertEqual(distance('abcdef', 'badcfe', 3), 3)
+        words = ['ciao', 'ciaoo', 'caio', 'cioa', 'miao', 'mia', 'a', 'acbd', 'abcd', 'dcba', 'simone', 'sinome']
+        for word1 in words:
+            for word2 in words:
+                unbounded = distance(word1, word2)
+                for max_distance in range(4):
+                    self.assertEqual(distance(word1, word2, max_distance), min(unbounded, max_distance + 1))
+
+class WordBatchDistancesTests(unittest.TestCase):
+    def setUp(self):
+        self.words = ['ciao', 'ciaoo', 'caio', 'cioa', 'miao', 'mia', 'a', '', 'acbd', 'abcd', 'dcba',
+                      'simone', 'sinome', 'siomen', u'caff\xe8', 'cafe', 'ciaociao', 'oaic']
+
+    def check(self):
+        for word1 in self.words:
+            for max_distance in range(4):
+                expected = [Word.damerau_levenshtein_distance(word1, word2, max_distance) for word2 in self.words]
+                self.assertListEqual(expected, Word.damerau_levenshtein_distances(word1, self.words, max_distance))
+        self.assertListEqual([], Word.damerau_levenshtein_distances('ciao', [], 2))
+
+    def test_python(self):
+        numpy = word_module.numpy
+        word_module.numpy = None
+        try:
+            self.check()
+        finally:
+            word_module.numpy = numpy
+
+    @unittest.skipIf(word_module.numpy is None, 'numpy is not installed')
+    def test_numpy(self):
+        self.assertGreaterEqual(len(self.words), Word.NUMPY_MIN_BATCH)
+        self.check()
+
+
+class WordWeightedTests(unittest.TestCase):
+    def test_weighted_distance(self):
+        words = ['ciao', 'ciaoo', 'caio', 'cioa', 'miao', 'mia', 'a', '', 'acbd', 'abcd', 'dcba', 'simone', 'sinome']
+        for word1 in words:
+            for word2 in words:
+                unbounded = Word.damerau_levenshtein_distance(word1, word2)
+                self.assertEqual(unbounded, Word.weighted_distance(word1, word2, EditCosts()))
+                for max_distance in range(4):
+                    self.assertEqual(min(unbounded, max_distance + 1),
+                                     Word.weighted_distance(word1, word2, EditCosts(), max_distance))
+                self.assertLessEqual(Word.weighted_distance(word1, word2, KeyboardCosts()), unbounded)
+        costs = KeyboardCosts(adjacent=0.25, transposition=0.5)
+        self.assertEqual(0.25, Word.weighted_distance('ciao', 'xiao', costs))  # c is next to x
+        self.assertEqual(1, Word.weighted_distance('ciao', 'piao', costs))
+        self.assertEqual(0.5, Word.weighted_distance('ciao', 'caio', costs))
+        self.assertEqual(0.75, Word.weighted_distance('ciao', 'xaio', costs))
+        self.assertEqual(1.5, Word.weighted_distance('ciao', 'xaio', costs, 0.5))
+
+    def test_phonetic_key(self):
+        for word1, word2 in (('phone', 'fone'), ('night', 'nite'), ('knight', 'nite'), ('cat', 'kat'),
+                             ('write', 'rite'), ('apple', 'aple'), ('through', 'thru'), ('science', 'sience')):
+            self.assertEqual(Word.phonetic_key(word1), Word.phonetic_key(word2))
+        self.assertNotEqual(Word.phonetic_key('cat'), Word.phonetic_key('cut') + 'x')
+        self.assertNotEqual(Word.phonetic_key('night'), Word.phonetic_key('nice'))
+        self.assertEqual('', Word.phonetic_key('123'))
+
+
 class WordDistTests(unittest.TestCase):
     def setUp(self):
         self.edit_distance_max = 2